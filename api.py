@@ -1,12 +1,10 @@
 from flask import Flask, request, jsonify
-from processing_functions import run_full_pipeline
+from config import API_MAX_BATCH_SIZE
+from processing_functions import run_full_pipeline, run_pipelines
 import logging
 
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(filename='api.log', level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 @app.route('/process_prompt', methods=['POST'])
@@ -14,6 +12,9 @@ def process_prompt():
     data = request.get_json(silent=True) or {}
     prompt = (data.get('prompt') or "").strip()
     mode = (data.get('mode') or "").strip() or None
+    prompts = data.get('prompts')
+    if isinstance(prompts, list) and prompts:
+        return process_batch(prompts, mode)
     if not prompt:
         return jsonify({'error': 'prompt is required'}), 400
 
@@ -29,5 +30,27 @@ def process_prompt():
         logger.error(f"Error processing prompt: {e}")
         return jsonify({'error': str(e)}), 500
 
+def process_batch(prompts, mode):
+    """Run several prompts' pipelines concurrently and return one entry per prompt."""
+    if len(prompts) > API_MAX_BATCH_SIZE:
+        return jsonify({'error': f'at most {API_MAX_BATCH_SIZE} prompts per batch'}), 400
+    prompts = [p.strip() if isinstance(p, str) else "" for p in prompts]
+    if not all(prompts):
+        return jsonify({'error': 'every prompt must be a non-empty string'}), 400
+
+    logger.info(f"Received batch of {len(prompts)} prompts")
+    outputs = []
+    for result in run_pipelines(prompts, mode=mode):
+        # gather(return_exceptions=True) also returns CancelledError and friends
+        if isinstance(result, BaseException):
+            logger.error(f"Error processing prompt: {result}")
+            outputs.append({'error': str(result) or type(result).__name__})
+        else:
+            outputs.append({'output': result.get("comprehensive", "")})
+    return jsonify({'outputs': outputs})
+
 if __name__ == '__main__':
+    # Configure logging only when run standalone; importers configure their own
+    logging.basicConfig(filename='api.log', level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
     app.run(debug=True)
@@ -1,5 +1,6 @@
 import os
-import json
+
+import json_utils
 
 
 def _load_env_json(key, default):
@@ -7,7 +8,7 @@ def _load_env_json(key, default):
     if not raw:
         return default
     try:
-        return json.loads(raw)
+        return json_utils.loads(raw)
     except Exception:
         return default
 
@@ -52,6 +53,43 @@ PROGRESS_MESSAGES = {
     "complete": "Process complete.\n\n",
 }
 
+# Progress messages without surrounding whitespace, for log-style output
+PROGRESS_LABELS = {phase: message.strip() for phase, message in PROGRESS_MESSAGES.items()}
+
 REQUEST_TIMEOUT_SEC = int(os.getenv("LOGIC_FILTER_REQUEST_TIMEOUT_SEC", "20"))
 MODEL_CALL_TIMEOUT_MS = int(os.getenv("LOGIC_FILTER_MODEL_TIMEOUT_MS", "120000"))
+# Lower bound for the per-model timeout adapted from observed latency;
+# MODEL_CALL_TIMEOUT_MS is the upper bound and the value before any samples
+MODEL_CALL_TIMEOUT_FLOOR_MS = int(os.getenv("LOGIC_FILTER_MODEL_TIMEOUT_FLOOR_MS", "30000"))
 DEFAULT_MODE = os.getenv("LOGIC_FILTER_MODE", "auto").lower()
+# Load every model a run will use as soon as it starts; disable when VRAM
+# can't hold them all and early loads would evict each other
+PRELOAD_PIPELINE_MODELS = os.getenv("LOGIC_FILTER_PRELOAD_MODELS", "1") == "1"
+# Responses kept for repeated temperature-0 calls; 0 disables the cache
+LLM_CACHE_SIZE = int(os.getenv("LOGIC_FILTER_LLM_CACHE_SIZE", "1024"))
+# Recent stage outputs kept per input so repeated runs return instantly; 0 disables
+STAGE_MEMO_SIZE = int(os.getenv("LOGIC_FILTER_STAGE_MEMO_SIZE", "32"))
+# Most prompts one /process_prompt batch request may carry
+API_MAX_BATCH_SIZE = int(os.getenv("LOGIC_FILTER_API_MAX_BATCH", "16"))
+# Log per-second rates of the status bar's Tk widget calls once a minute, to
+# check that UI changes actually cut Tk traffic
+TK_CALL_STATS = os.getenv("LOGIC_FILTER_TK_CALL_STATS", "0") == "1"
+
+# Optional semantic cache for the analysis stage (needs numpy and an Ollama
+# embedding model such as nomic-embed-text); empty disables it
+SEMANTIC_CACHE_MODEL = os.getenv("LOGIC_FILTER_EMBED_MODEL", "")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LOGIC_FILTER_SEMANTIC_THRESHOLD", "0.92"))
+
+# Optional llama-cpp-python in-process inference, keyed by Ollama model name:
+# {"llama3.2:latest": "/models/llama3.2.gguf"}
+IN_PROCESS_MODELS = _load_env_json("LOGIC_FILTER_GGUF_MODELS_JSON", {})
+IN_PROCESS_MAX_PROMPT_CHARS = int(os.getenv("LOGIC_FILTER_IN_PROCESS_MAX_CHARS", "4000"))
+
+# Speculative decoding for in-process models: draft tokens verified per forward pass
+SPECULATIVE_DRAFT_TOKENS = _load_env_json(
+    "LOGIC_FILTER_SPECULATIVE_JSON",
+    {
+        "deepseek-r1": 10,
+        "deepseek-r1:14b": 10,
+    },
+)
@@ -0,0 +1,60 @@
+import logging
+import threading
+
+logger = logging.getLogger("prompt_enhancer")
+
+class InProcessModelManager:
+    """Runs GGUF models in-process through llama-cpp-python"""
+    def __init__(self, model_paths, n_ctx=8192, n_gpu_layers=-1, draft_tokens=None):
+        self.model_paths = dict(model_paths or {})
+        self.draft_tokens = dict(draft_tokens or {})
+        self.n_ctx = n_ctx
+        self.n_gpu_layers = n_gpu_layers
+        self.models = {}
+        self._inference_locks = {}
+        self._lock = threading.Lock()
+
+    def has_model(self, model_name):
+        """Check if a GGUF file is configured for the given Ollama model name"""
+        return model_name in self.model_paths
+
+    def _load(self, model_name):
+        """Load a model once and keep it (and its KV cache) resident"""
+        with self._lock:
+            llm = self.models.get(model_name)
+            if llm is None:
+                from llama_cpp import Llama
+                logger.info(f"Loading in-process model {model_name}")
+                kwargs = {}
+                num_pred_tokens = self.draft_tokens.get(model_name)
+                if num_pred_tokens:
+                    # Speculative decoding: drafted tokens are verified in one batch
+                    from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+                    kwargs["draft_model"] = LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens)
+                llm = Llama(
+                    model_path=self.model_paths[model_name],
+                    n_gpu_layers=self.n_gpu_layers,
+                    n_ctx=self.n_ctx,
+                    verbose=False,
+                    **kwargs
+                )
+                self.models[model_name] = llm
+                self._inference_locks[model_name] = threading.Lock()
+            return llm
+
+    def chat(self, model, messages, options=None, response_format=None):
+        """Ollama-compatible chat call served by llama.cpp.
+
+        Calls to one model run one at a time, since a llama.cpp context is not
+        thread-safe. No timeout applies: generation runs in this thread and
+        cannot be interrupted, so options["timeout"] is ignored.
+        """
+        llm = self._load(model)
+        kwargs = {}
+        if options and "temperature" in options:
+            kwargs["temperature"] = options["temperature"]
+        if response_format == "json":
+            kwargs["response_format"] = {"type": "json_object"}
+        with self._inference_locks[model]:
+            response = llm.create_chat_completion(messages=messages, **kwargs)
+        return {"message": {"content": response["choices"][0]["message"]["content"]}}
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import LLM_CACHE_SIZE
+import json_utils
+
+logger = logging.getLogger("prompt_enhancer")
+
+
+def cache_key(model_name: str, messages: List[Dict], options: Optional[Dict] = None) -> str:
+    """Hash a chat request so identical deterministic calls share a cache entry."""
+    payload = json_utils.dumps_sorted(
+        {"model": model_name, "messages": messages, "options": options or {}}
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+
+class DiskCache:
+    """SQLite store of compressed model responses that survives restarts."""
+    def __init__(self, db_path: str, ttl_seconds: float = 7 * 24 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        try:
+            conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value BLOB, created_at INTEGER)"
+            )
+            return conn
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open response cache database: {e}")
+            return None
+
+    def get(self, key: str) -> Optional[str]:
+        if self._db is None:
+            return None
+        with self._lock:
+            if self._db is None:
+                return None
+            try:
+                row = self._db.execute(
+                    "SELECT value FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, int(time.time() - self.ttl_seconds))
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read cached response: {e}")
+                return None
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def set(self, key: str, value: str) -> None:
+        if self._db is None:
+            return
+        blob = zlib.compress(value.encode("utf-8"))
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                    (key, blob, int(time.time()))
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Failed to store cached response: {e}")
+
+    def clear(self) -> None:
+        if self._db is None:
+            return
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute("DELETE FROM responses")
+            except sqlite3.Error as e:
+                logger.error(f"Failed to clear cached responses: {e}")
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+
+class ResponseCache:
+    """Thread-safe LRU of model responses keyed by request hash.
+
+    With a DiskCache attached, memory misses fall through to disk and every
+    new response is also written there.
+    """
+    def __init__(self, maxsize: int = 1024, disk: Optional[DiskCache] = None):
+        self.maxsize = maxsize
+        self.disk = disk
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+        value = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._remember(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def _remember(self, key: str, value: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats = {"hits": 0, "misses": 0}
+
+
+response_cache = ResponseCache(LLM_CACHE_SIZE)
+
+
+def attach_disk_cache(db_path: str, ttl_seconds: float) -> None:
+    """Back ``response_cache`` with a DiskCache at ``db_path``, once per process."""
+    if response_cache.disk is None:
+        response_cache.disk = DiskCache(db_path, ttl_seconds=ttl_seconds)
+
+
+def close_disk_cache() -> None:
+    disk, response_cache.disk = response_cache.disk, None
+    if disk is not None:
+        disk.close()
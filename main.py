@@ -1,41 +1,42 @@
-import tkinter as tk
+import asyncio
+import collections
 import logging
+import multiprocessing
 import os
 import threading
-from rich.logging import RichHandler
-import customtkinter as ctk
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from settings_manager import SettingsManager
 from ollama_service_manager import OllamaServiceManager, OllamaError
 from processing_history import ProcessingHistory
-from ui_components import (
-    create_model_indicators,
-    create_scrolled_text,
-    create_status_bar,
-    create_toolbar,
-    create_menu,
-    LoadingIndicator,
-    update_output,
-    handle_phase_error
-)
-from processing_functions import (
-    run_full_pipeline,
-    validate_models
-)
-from config import OLLAMA_MODELS
-from ui_components import set_output_widget
-
-# Initialize logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(message)s",
-    datefmt="[%X]",
-    handlers=[RichHandler(rich_tracebacks=True)]
-)
+import llm_cache
+from config import OLLAMA_MODELS, PROGRESS_LABELS
+
+# GUI-only dependencies (customtkinter, rich, ui_components) and the
+# pipeline are imported where they are used, so importing this module for
+# app_state (as processing_functions and the API do) stays cheap.
 logger = logging.getLogger("prompt_enhancer")
 
-# Initialize customtkinter
-ctk.set_appearance_mode("dark")
-ctk.set_default_color_theme("blue")
+# Window in which queued UI callbacks are batched into one Tk event
+UI_BATCH_MS = 50
+
+# Progress bar percentage and active model indicator per completed phase
+PHASE_PROGRESS = {
+    "analysis_done": 20,
+    "generation_done": 40,
+    "vetting_done": 60,
+    "finalize_done": 80,
+    "enhance_done": 90,
+    "complete": 100,
+}
+PHASE_MODELS = {
+    "analysis_done": "analysis",
+    "generation_done": "generation",
+    "vetting_done": "vetting",
+    "finalize_done": "finalization",
+    "enhance_done": "enhancement",
+    "complete": "comprehensive",
+}
 
 class ApplicationState:
     """Global application state manager"""
@@ -50,29 +51,93 @@ class ApplicationState:
         self.toolbar = None
         self.menu_manager = None
         self.model_indicators = None
+        self._active_model = None
+        self.phase_results = {}
         self.ollama_manager = None
-        self.is_processing = False
+        self.loop = None
+        self.executor = None
+        self.processing_future = None
+        self._ui_ops = collections.deque()
+        self._ui_scheduled = False
+        self._ui_lock = threading.Lock()
 
     def initialize(self, root):
         """Initialize application state with root window"""
+        from ui_components import LoadingIndicator
+
         self.root = root
         self.settings_manager = SettingsManager()
-        self.processing_history = ProcessingHistory()
+        self.processing_history = ProcessingHistory(
+            db_path=os.path.join(os.path.dirname(__file__), "history.db")
+        )
         self.processing_history.max_history = self.settings_manager.get("max_history", 50)
         self.ollama_manager = OllamaServiceManager(self)
         self.loading = LoadingIndicator(root)
+        self.start_event_loop()
+
+    def start_event_loop(self):
+        """Start the persistent asyncio loop that runs pipeline work off the Tk thread"""
+        self.loop = asyncio.new_event_loop()
+        # asyncio.to_thread uses the default executor; size it for blocking Ollama I/O
+        pool_size = self.settings_manager.get("thread_pool_size", 32) if self.settings_manager else 32
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="ollama-io")
+        self.loop.set_default_executor(self.executor)
+        loop_thread = threading.Thread(target=self.loop.run_forever, name="pipeline-loop")
+        loop_thread.daemon = True
+        loop_thread.start()
+
+    def shutdown(self):
+        """Release background resources before the window closes"""
+        if self.settings_manager:
+            self.settings_manager.flush()
+        if self.ollama_manager:
+            self.ollama_manager.close()
+        llm_cache.close_disk_cache()
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.executor:
+            self.executor.shutdown(wait=False)
 
     def reset_indicators(self):
         """Reset all model indicators to inactive state"""
+        self._active_model = None
         if self.model_indicators:
             for label in self.model_indicators.values():
                 label.configure(text_color="gray")
 
     def set_active_model(self, model_type):
-        """Set a model indicator as active"""
-        if self.model_indicators and model_type in self.model_indicators:
-            self.reset_indicators()
-            self.model_indicators[model_type].configure(text_color="#4a90e2")
+        """Set a model indicator as active, recoloring only the labels that change"""
+        if not self.model_indicators or model_type not in self.model_indicators:
+            return
+        if model_type == self._active_model:
+            return
+        if self._active_model in self.model_indicators:
+            self.model_indicators[self._active_model].configure(text_color="gray")
+        self.model_indicators[model_type].configure(text_color="#4a90e2")
+        self._active_model = model_type
+
+    def schedule_ui(self, fn):
+        """Queue a UI callback; callbacks queued within UI_BATCH_MS run in one Tk event"""
+        if not self.root:
+            return
+        with self._ui_lock:
+            self._ui_ops.append(fn)
+            if self._ui_scheduled:
+                return
+            self._ui_scheduled = True
+        self.root.after(UI_BATCH_MS, self._drain_ui)
+
+    def _drain_ui(self):
+        """Run every queued UI callback on the Tk thread"""
+        with self._ui_lock:
+            ops = list(self._ui_ops)
+            self._ui_ops.clear()
+            self._ui_scheduled = False
+        for fn in ops:
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"UI update failed: {e}")
 
     def update_references(self, **kwargs):
         """Update component references"""
@@ -82,91 +147,150 @@ class ApplicationState:
 
 def process_prompt():
     """Process the input prompt through the enhancement pipeline."""
-    if app_state.is_processing:
+    from processing_functions import avalidate_models, run_full_pipeline
+    from ui_components import (
+        append_output,
+        handle_phase_error,
+        mark_output,
+        replace_output_from,
+        sanitize_output,
+        update_output
+    )
+
+    # Only the Tk thread submits work, so checking the pending future is race-free
+    if app_state.processing_future and not app_state.processing_future.done():
         return
 
-    app_state.is_processing = True
-    def run_processing():
+    prompt = app_state.input_text.get("1.0", "end").strip()
+
+    async def run_processing():
         try:
             def ui_update(text, is_error=False):
-                if app_state.root:
-                    app_state.root.after(0, lambda: update_output(text, is_error))
+                app_state.schedule_ui(lambda: update_output(text, is_error))
 
-            prompt = app_state.input_text.get("1.0", "end").strip()
             if not prompt:
                 ui_update("Error: No prompt entered.", is_error=True)
                 return
 
-            if not app_state.ollama_manager.initialize_ollama():
+            if not await asyncio.to_thread(app_state.ollama_manager.initialize_ollama):
                 ui_update("Error: Ollama is not ready.", is_error=True)
                 return
 
-            unavailable = validate_models()
+            unavailable = await avalidate_models()
             if unavailable:
                 missing = ", ".join([m for _, m in unavailable])
                 ui_update(f"Error: Missing models: {missing}", is_error=True)
                 return
 
-            if app_state.root:
-                app_state.root.after(0, lambda: app_state.status_bar.set_status("Processing"))
-                app_state.root.after(0, lambda: app_state.loading.start(0))
-
-            output_chunks = []
-            phase_to_progress = {
-                "analysis_done": 20,
-                "generation_done": 40,
-                "vetting_done": 60,
-                "finalize_done": 80,
-                "enhance_done": 90,
-                "complete": 100,
-            }
-            phase_to_model = {
-                "analysis_done": "analysis",
-                "generation_done": "generation",
-                "vetting_done": "vetting",
-                "finalize_done": "finalization",
-                "enhance_done": "enhancement",
-                "complete": "comprehensive",
-            }
+            app_state.schedule_ui(lambda: app_state.status_bar.set_status("Processing"))
+            app_state.schedule_ui(lambda: app_state.loading.start(0))
+
+            pending = collections.deque()
+            app_state.phase_results = {}
+            app_state.schedule_ui(lambda: update_output(""))
+
+            # Stages whose streamed text starts at a "stream-<stage>" mark, and
+            # the stage streaming now
+            marked = set()
+            live = [None]
+
+            def flush_output():
+                # Text is batched into one insert; queued widget edits run in order
+                chunks = []
+                while pending:
+                    item = pending.popleft()
+                    if isinstance(item, str):
+                        chunks.append(item)
+                        continue
+                    if chunks:
+                        append_output("".join(chunks))
+                        chunks = []
+                    item()
+                if chunks:
+                    append_output("".join(chunks))
+
+            def stream_cb(stage, delta):
+                mark = f"stream-{stage}"
+                if delta is None:
+                    # The attempt failed; drop its partial text before the retry
+                    if stage in marked:
+                        marked.discard(stage)
+                        pending.append(partial(replace_output_from, mark, ""))
+                    live[0] = None
+                else:
+                    if stage not in marked:
+                        marked.add(stage)
+                        pending.append(partial(mark_output, mark))
+                    live[0] = stage
+                    pending.append(delta)
+                app_state.schedule_ui(flush_output)
 
             def progress_cb(phase, message, content):
-                if message:
-                    output_chunks.append(message.strip())
                 if content:
-                    output_chunks.append(content)
+                    app_state.phase_results[phase] = content
+                    text = sanitize_output(content) + "\n\n"
+                    if live[0] is not None:
+                        # Swap the raw streamed text for the sanitized result
+                        pending.append(partial(replace_output_from, f"stream-{live[0]}", text))
+                    else:
+                        pending.append(text)
+                live[0] = None
+                if message:
+                    pending.append((PROGRESS_LABELS.get(phase) or message.strip()) + "\n\n")
 
                 def _ui_update():
-                    if phase in phase_to_model:
-                        app_state.set_active_model(phase_to_model[phase])
-                    if phase in phase_to_progress:
-                        app_state.loading.start(phase_to_progress[phase])
-                    update_output("\n\n".join([c for c in output_chunks if c]))
+                    model_type = PHASE_MODELS.get(phase)
+                    if model_type:
+                        app_state.set_active_model(model_type)
+                    progress = PHASE_PROGRESS.get(phase)
+                    if progress is not None:
+                        app_state.loading.start(progress)
+                    flush_output()
 
-                if app_state.root:
-                    app_state.root.after(0, _ui_update)
+                app_state.schedule_ui(_ui_update)
 
             mode = app_state.settings_manager.get("mode", None) if app_state.settings_manager else None
-            results = run_full_pipeline(prompt, progress_cb=progress_cb, mode=mode)
+            history = app_state.processing_history
+            # Stored phases only resume an interrupted run with the same models
+            prompt_key = history.prompt_key(prompt, mode, OLLAMA_MODELS)
+            results = await asyncio.to_thread(
+                run_full_pipeline,
+                prompt,
+                progress_cb=progress_cb,
+                mode=mode,
+                stream_cb=stream_cb,
+                completed=history.get_phases(prompt_key),
+                on_result=lambda stage, output: history.add_phase(prompt_key, stage, output)
+            )
+
+            # The run finished, so its phases are no longer needed for recovery
+            history.clear_phases(prompt_key)
 
             # Store in history
             app_state.processing_history.add(prompt, results.get("comprehensive", ""))
 
         except Exception as e:
             error_msg = handle_phase_error("Processing", e, None, None, "")
-            if app_state.root:
-                app_state.root.after(0, lambda: update_output(error_msg, is_error=True))
+            # Append so the phases that did finish stay on screen
+            app_state.schedule_ui(lambda: append_output(error_msg, is_error=True))
         finally:
-            app_state.is_processing = False
-            if app_state.root:
-                app_state.root.after(0, app_state.loading.stop)
-                app_state.root.after(0, lambda: app_state.status_bar.set_status("Ready"))
+            app_state.schedule_ui(app_state.loading.stop)
+            app_state.schedule_ui(lambda: app_state.status_bar.set_status("Ready"))
 
-    processing_thread = threading.Thread(target=run_processing)
-    processing_thread.daemon = True
-    processing_thread.start()
+    app_state.processing_future = asyncio.run_coroutine_threadsafe(run_processing(), app_state.loop)
 
 def setup_main_window(root):
     """Set up the main application window"""
+    import customtkinter as ctk
+    from ui_components import (
+        create_menu,
+        create_model_indicators,
+        create_scrolled_text,
+        create_status_bar,
+        create_toolbar,
+        set_output_widget
+    )
+
     root.title("Prompt Enhancer")
 
     # Create and configure the main container
@@ -178,11 +302,6 @@ def setup_main_window(root):
     indicators_frame.pack(fill="x", pady=(0, 10))
     app_state.model_indicators = indicators
 
-    # Create toolbar
-    toolbar = create_toolbar(main_container, input_text, output_text)
-    toolbar.pack(fill="x", pady=(0, 10))
-    app_state.toolbar = toolbar
-
     # Create text areas
     input_frame = ctk.CTkFrame(main_container)
     input_frame.pack(fill="both", expand=True)
@@ -203,6 +322,11 @@ def setup_main_window(root):
     output_text.pack(fill="both", expand=True, pady=(5, 10))
     set_output_widget(output_text)
 
+    # Create toolbar once the text widgets it operates on exist
+    toolbar = create_toolbar(main_container, input_text, output_text)
+    toolbar.pack(fill="x", pady=(0, 10), before=input_frame)
+    app_state.toolbar = toolbar
+
     # Create process button
     process_btn = ctk.CTkButton(
         main_container,
@@ -235,30 +359,75 @@ def setup_main_window(root):
 # Create global application state
 app_state = ApplicationState()
 
-def start_flask_app():
-    """Start the Flask app in a separate thread."""
+def start_flask_app(threads=8):
+    """Serve the Flask API; normally run in its own process so requests don't contend with Tk for the GIL."""
+    if multiprocessing.parent_process() is not None:
+        # A spawned child starts with unconfigured logging; the GUI's
+        # handlers live in the parent
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s - %(processName)s - %(levelname)s - %(message)s"
+        )
     from api import app as flask_app
-    flask_app.run(debug=True, use_reloader=False)
+    try:
+        from waitress import serve
+    except ImportError:
+        logger.warning("waitress is not installed; using the threaded Flask server")
+        flask_app.run(host="127.0.0.1", port=5000, debug=False, use_reloader=False, threaded=True)
+        return
+    serve(flask_app, host="127.0.0.1", port=5000, threads=threads, connection_limit=64)
+
+def start_api_server(settings_manager):
+    """Start the API in a spawned process, or in a daemon thread when that is disabled or fails."""
+    threads = settings_manager.get("api_threads", 8)
+    if settings_manager.get("api_process", True):
+        try:
+            # spawn avoids forking a live Tk interpreter
+            multiprocessing.get_context("spawn").Process(
+                target=start_flask_app,
+                args=(threads,),
+                name="flask-api",
+                daemon=True
+            ).start()
+            return
+        except Exception as e:
+            logger.warning(f"Could not start the API process ({e}); serving it from a thread")
+    threading.Thread(target=start_flask_app, args=(threads,), name="flask-api", daemon=True).start()
 
 def main():
     """Main entry point of the application."""
+    import tkinter as tk
+    import customtkinter as ctk
+    from rich.logging import RichHandler
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",
+        datefmt="[%X]",
+        handlers=[RichHandler(rich_tracebacks=True)]
+    )
+    ctk.set_default_color_theme("blue")
+
     root = tk.Tk()
     app_state.initialize(root)
     ctk.set_appearance_mode(app_state.settings_manager.get("theme", "dark"))
 
     # Make sure customtkinter's images are in the correct path
     assets_dir = os.path.join(os.path.dirname(__file__), "assets")
-    if not os.path.exists(assets_dir):
-        os.makedirs(assets_dir)
+    os.makedirs(assets_dir, exist_ok=True)
     os.environ["CUSTOMTKINTER_IMAGES_PATH"] = assets_dir
 
     # Set up the main window
     setup_main_window(root)
+    # Probe Ollama after the first paint so a slow or absent service can't delay the window
+    root.after(100, app_state.ollama_manager.check_service_status)
+
+    def on_close():
+        app_state.shutdown()
+        root.destroy()
+    root.protocol("WM_DELETE_WINDOW", on_close)
 
-    # Start the Flask app in a separate thread
-    flask_thread = threading.Thread(target=start_flask_app)
-    flask_thread.daemon = True
-    flask_thread.start()
+    start_api_server(app_state.settings_manager)
 
     # Start the main loop
     root.mainloop()
@@ -0,0 +1,301 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger("prompt_enhancer")
+
+# A model that fails this many times in a row is skipped for OPEN_SECONDS
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 60.0
+
+
+class _ModelHealth:
+    """Consecutive-failure count and last failure time for one model."""
+    __slots__ = ("failures", "last_failure")
+
+    def __init__(self):
+        self.failures = 0
+        self.last_failure = 0.0
+
+
+_health: Dict[str, _ModelHealth] = {}
+_health_lock = threading.Lock()
+
+
+def is_open(model_name: str) -> bool:
+    """True while a model's circuit is open and calls should skip it."""
+    health = _health.get(model_name)
+    if health is None or health.failures < FAILURE_THRESHOLD:
+        return False
+    return time.monotonic() - health.last_failure < OPEN_SECONDS
+
+
+def record_success(model_name: str) -> None:
+    health = _health.get(model_name)
+    if health is not None and health.failures:
+        with _health_lock:
+            health.failures = 0
+
+
+def record_failure(model_name: str) -> None:
+    with _health_lock:
+        health = _health.setdefault(model_name, _ModelHealth())
+        health.failures += 1
+        health.last_failure = time.monotonic()
+        if health.failures == FAILURE_THRESHOLD:
+            logger.warning(f"Model {model_name} failed {FAILURE_THRESHOLD} times; skipping it for {OPEN_SECONDS:.0f}s")
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None,
+                  base: float = 0.5, cap: float = 8.0) -> float:
+    """Seconds to wait before retry ``attempt`` (1-based): exponential with jitter.
+
+    An error carrying a ``retry_after`` hint (seconds) overrides the schedule.
+    """
+    hint = getattr(error, "retry_after", None)
+    if isinstance(hint, (int, float)) and hint >= 0:
+        return min(float(hint), cap)
+    if base <= 0:
+        return 0.0
+    return min(base * 2 ** (attempt - 1) + random.uniform(0, base), cap)
+
+
+class Breaker:
+    """Service-wide circuit breaker: CLOSED, OPEN, then HALF-OPEN with one probe.
+
+    Per-model circuits skip a broken model; this one stops every call while
+    the Ollama server itself is down, instead of each paying a full timeout.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.fail_count = 0
+        self.opened_at = 0.0
+        self.inflight_probe = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected, without claiming the probe."""
+        if self.state == self.CLOSED:
+            return False
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at < self.open_seconds
+        return self.inflight_probe
+
+    def allow(self) -> bool:
+        """Whether a call may proceed; after the cool-down only one probe is let through."""
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                logger.info("Ollama circuit half-open; probing")
+            if self.state == self.HALF_OPEN:
+                if self.inflight_probe:
+                    return False
+                self.inflight_probe = True
+            return True
+
+    def record_success(self) -> None:
+        if self.state == self.CLOSED and not self.fail_count:
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Ollama circuit closed")
+            self.state = self.CLOSED
+            self.fail_count = 0
+            self.inflight_probe = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.fail_count += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.fail_count >= self.threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                logger.warning(f"Ollama circuit open after {self.fail_count} failures; failing fast for {self.open_seconds:.0f}s")
+            self.inflight_probe = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.fail_count = 0
+            self.inflight_probe = False
+
+
+service_breaker = Breaker()
+
+
+# Programming errors fail the same way on every model, so retrying or falling
+# back only delays the report
+NON_RETRYABLE = (TypeError, AttributeError, NameError, LookupError, NotImplementedError, ImportError)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """False when an error, or the error it wraps, is a programming error."""
+    while error is not None:
+        if isinstance(error, NON_RETRYABLE):
+            return False
+        error = error.__cause__
+    return True
+
+
+# Failures to reach the Ollama server at all. A read timeout or an error
+# response concerns one model, so it is left to that model's circuit.
+SERVICE_ERRORS = (ConnectionError,)
+if requests is not None:
+    SERVICE_ERRORS += (requests.exceptions.ConnectionError,)
+if httpx is not None:
+    SERVICE_ERRORS += (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def is_service_failure(error: BaseException) -> bool:
+    """True when an error, or the error it wraps, means the server is unreachable."""
+    while error is not None:
+        if isinstance(error, SERVICE_ERRORS):
+            return True
+        error = error.__cause__
+    return False
+
+
+# A response that did not arrive in time: the model may just need longer
+TIMEOUT_ERRORS = (TimeoutError,)
+if requests is not None:
+    TIMEOUT_ERRORS += (requests.exceptions.ReadTimeout,)
+if httpx is not None:
+    TIMEOUT_ERRORS += (httpx.ReadTimeout,)
+
+
+def is_timeout(error: BaseException) -> bool:
+    """True when an error, or the error it wraps, is a read timeout."""
+    while error is not None:
+        if isinstance(error, TIMEOUT_ERRORS):
+            return True
+        error = error.__cause__
+    return False
+
+
+def reset_health() -> None:
+    with _health_lock:
+        _health.clear()
+        _latency.clear()
+    service_breaker.reset()
+
+
+class ModelPool:
+    """A primary model and its fallbacks, tried in order.
+
+    Stage functions take the model name as their last positional argument,
+    so ``call(func, *args)`` invokes ``func(*args, model)`` for each model.
+    """
+    def __init__(self, primary: str, fallbacks: Iterable[str] = (), max_retries: int = 2,
+                 backoff_base: float = 0.5):
+        self.primary = primary
+        self.fallbacks: List[str] = [m for m in fallbacks if m != primary]
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+    def call(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        last_error = None
+        failures = 0
+        attempts = [(self.primary, self.max_retries)] + [(m, 1) for m in self.fallbacks]
+        for model_name, tries in attempts:
+            if is_open(model_name):
+                logger.info(f"Skipping model {model_name}: circuit open")
+                continue
+            if model_name != self.primary:
+                logger.info(f"Trying fallback model: {model_name}")
+            for _ in range(tries):
+                if failures:
+                    # Every model shares one Ollama server, so back off across fallbacks too
+                    time.sleep(backoff_delay(failures, last_error, self.backoff_base))
+                try:
+                    result = func(*args, model_name, **kwargs)
+                    record_success(model_name)
+                    return result
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    last_error = e
+                    failures += 1
+                    record_failure(model_name)
+                    logger.warning(f"Error with model {model_name}: {e}")
+                    if service_breaker.is_open():
+                        # The server is down; other models will not fare better
+                        raise
+                    if is_open(model_name):
+                        break
+        raise last_error or Exception("All models failed")
+
+
+class LatencyStats:
+    """Smoothed latency and deviation for one model, as in TCP's RTO estimate.
+
+    As in TCP, a timeout doubles the timeout until the next successful call
+    supplies a fresh sample.
+    """
+    __slots__ = ("mean", "deviation", "samples", "backoff")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.samples = 0
+        self.backoff = 1
+
+    def add(self, seconds: float, alpha: float = 0.125, beta: float = 0.25) -> None:
+        if not self.samples:
+            self.mean = seconds
+            self.deviation = seconds / 2
+        else:
+            self.deviation += beta * (abs(seconds - self.mean) - self.deviation)
+            self.mean += alpha * (seconds - self.mean)
+        self.samples += 1
+        self.backoff = 1
+
+    def timeout_ms(self, floor_ms: int, ceiling_ms: int) -> int:
+        """Twice a high-percentile latency estimate, backed off and clamped to [floor, ceiling]."""
+        if not self.samples:
+            return ceiling_ms
+        estimate_ms = 2000.0 * (self.mean + 4 * self.deviation)
+        return int(min(max(estimate_ms, floor_ms) * self.backoff, ceiling_ms))
+
+
+_latency: Dict[str, LatencyStats] = {}
+
+
+def record_latency(model_name: str, seconds: float) -> None:
+    with _health_lock:
+        _latency.setdefault(model_name, LatencyStats()).add(seconds)
+
+
+def record_timeout(model_name: str) -> None:
+    """Double a model's timeout after a call to it timed out."""
+    with _health_lock:
+        stats = _latency.get(model_name)
+        # The ceiling applies before any samples, so there is nothing to raise
+        if stats is not None and stats.backoff < 64:
+            stats.backoff *= 2
+
+
+def timeout_for(model_name: str, floor_ms: int, ceiling_ms: int) -> int:
+    """Per-model request timeout derived from that model's observed latency."""
+    stats = _latency.get(model_name)
+    if stats is None:
+        return ceiling_ms
+    return stats.timeout_ms(floor_ms, ceiling_ms)
@@ -1,12 +1,20 @@
 import logging
+import math
+import os
+import threading
 import time
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from config import REQUEST_TIMEOUT_SEC
+import json_utils
+from config import OLLAMA_MODELS, REQUEST_TIMEOUT_SEC
 
 logger = logging.getLogger("prompt_enhancer")
 
+OLLAMA_URL = "http://localhost:11434"
+AVAILABLE_MODELS_TTL_SEC = 30
+
 class OllamaServiceManager:
     """Manages Ollama service and model availability"""
     def __init__(self, app_state):
@@ -14,23 +22,38 @@ class OllamaServiceManager:
         self.ollama_ready = False
         self.models_loaded = False
         self.ollama_module = None
+        self._connection_warmed = False
+        self._preload_started = False
+        self._preloading = set()
+        self._preload_lock = threading.Lock()
+        self._status_bar = None
         self.check_interval = 30000  # 30 seconds between checks
-        self._last_check = 0
-        self._start_service_check()
-        
-    def _start_service_check(self):
-        """Start periodic service checking"""
-        if self.app_state.root:
-            self.check_service_status()
-        
+        self._timer_id = None
+        self.keep_alive = self.app_state.settings_manager.get('ollama_keep_alive', '30m')
+        self.max_inflight = self.app_state.settings_manager.get('max_inflight_requests', 4)
+        # Bounds concurrent /api/chat calls so parallel pipelines queue here
+        # instead of piling requests onto Ollama
+        self._inflight = threading.BoundedSemaphore(max(self.max_inflight, 1))
+        self._client = None
+        self._clients = {}
+        self._available = None
+        self._available_at = 0.0
+        self._available_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=0))
+        self.session.headers.update({"Connection": "keep-alive"})
+
     def check_ollama_service(self):
         """Check if Ollama service is running and accessible."""
         try:
-            response = requests.get(
-                "http://localhost:11434/api/version",
+            # Ollama has no health endpoint; HEAD on the model list is the cheapest probe
+            response = self.session.head(
+                f"{OLLAMA_URL}/api/tags",
                 timeout=self.app_state.settings_manager.get('request_timeout', REQUEST_TIMEOUT_SEC)
             )
-            if response.status_code == 200:
+            if 200 <= response.status_code < 300:
+                if not self._connection_warmed:
+                    self._warm_connection()
                 return True
             logger.warning(f"Ollama health check failed with status {response.status_code}")
             return False
@@ -44,67 +67,204 @@ class OllamaServiceManager:
             logger.error(f"Unexpected error checking Ollama service: {e}")
             return False
 
+    def _warm_connection(self):
+        """Issue one full request so the pooled connection is primed before chat()"""
+        try:
+            self.refresh_available_models()
+            self._connection_warmed = True
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Ollama connection warm-up failed: {e}")
+
+    def refresh_available_models(self):
+        """Cache the names of locally installed models from /api/tags"""
+        response = self.session.get(
+            f"{OLLAMA_URL}/api/tags",
+            timeout=self.app_state.settings_manager.get('request_timeout', REQUEST_TIMEOUT_SEC)
+        )
+        response.raise_for_status()
+        models = json_utils.loads(response.content).get("models", [])
+        self._available = {model_key(m.get("name", "")) for m in models}
+        self._available_at = time.monotonic()
+        return self._available
+
     def initialize_ollama(self):
         """Initialize Ollama service and models"""
         if self.check_ollama_service():
             try:
                 if self.ollama_module is None:
+                    os.environ.setdefault("OLLAMA_KEEP_ALIVE", str(self.keep_alive))
                     import ollama
                     self.ollama_module = ollama
                 self.ollama_ready = True
-                if self.app_state.status_bar:
-                    self.app_state.status_bar.set_model_status("Connected")
-                    self.app_state.status_bar.set_status("Ollama service ready")
+                if not self._preload_started:
+                    self._preload_started = True
+                    self.preload(OLLAMA_MODELS["analysis"])
+                self._report_status("Connected", "Ollama service ready")
                 return True
             except ImportError:
-                if self.app_state.status_bar:
-                    self.app_state.status_bar.set_model_status("Not installed", is_error=True)
-                    self.app_state.status_bar.set_status("Please install Ollama", is_error=True)
+                self._report_status("Not installed", "Please install Ollama", is_error=True)
                 return False
         else:
-            if self.app_state.status_bar:
-                self.app_state.status_bar.set_model_status("Not running", is_error=True)
-                self.app_state.status_bar.set_status("Start Ollama service", is_error=True)
+            self._report_status("Not running", "Start Ollama service", is_error=True)
             return False
 
+    def _report_status(self, model_status, status, is_error=False):
+        """Show connection state in the status bar, marshalled onto the Tk thread"""
+        if self._status_bar is None:
+            self._status_bar = self.app_state.status_bar
+            if self._status_bar is None:
+                return
+        status_bar = self._status_bar
+
+        def update():
+            status_bar.set_model_status(model_status, is_error=is_error)
+            status_bar.set_status(status, is_error=is_error)
+
+        self.app_state.schedule_ui(update)
+
+    def preload(self, model):
+        """Load a model's weights in the background so its first call skips the cold start"""
+        if not self.ollama_ready:
+            return
+        with self._preload_lock:
+            if model in self._preloading:
+                return
+            self._preloading.add(model)
+        threading.Thread(target=self._preload_model, args=(model,), name="ollama-preload", daemon=True).start()
+
+    def _preload_model(self, model):
+        try:
+            # An empty prompt makes Ollama load the weights without generating
+            self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+            logger.info(f"Preloaded model {model}")
+        except Exception as e:
+            logger.warning(f"Failed to preload model {model}: {e}")
+        finally:
+            with self._preload_lock:
+                self._preloading.discard(model)
+
     def check_service_status(self):
-        """Check Ollama service status periodically"""
-        current_time = time.time() * 1000  # Convert to milliseconds
-        
-        # Only check if enough time has passed since last check
-        if current_time - self._last_check >= self.check_interval:
-            self._last_check = current_time
-            if not self.ollama_ready:
-                if self.initialize_ollama():
-                    if self.app_state.status_bar:
-                        self.app_state.status_bar.set_status("Ollama connected")
-            
+        """Check Ollama service status, re-arming a single Tk timer until connected"""
+        self._timer_id = None
+        if not self.ollama_ready:
+            if self.initialize_ollama():
+                self._report_status("Connected", "Ollama connected")
+
         # Schedule next check only if not ready
-        if not self.ollama_ready and self.app_state.root:
-            self.app_state.root.after(self.check_interval, self.check_service_status)
+        if not self.ollama_ready and self.app_state.root and self._timer_id is None:
+            self._timer_id = self.app_state.root.after(self.check_interval, self.check_service_status)
 
     def chat(self, *args, **kwargs):
         """Wrapper for ollama.chat that ensures service is initialized"""
         if not self.ollama_ready:
             if not self.initialize_ollama():
-                raise OllamaError("Ollama service not ready")
-        return self.ollama_module.chat(*args, **kwargs)
+                raise OllamaUnavailableError("Ollama service not ready")
+        # Keep weights resident between pipeline phases instead of reloading
+        kwargs.setdefault("keep_alive", self.keep_alive)
+        client = self._client_for(kwargs)
+        with self._inflight:
+            return client.chat(*args, **kwargs)
+
+    @property
+    def client(self):
+        """Shared ollama.Client for calls without a timeout, reusing its connection pool"""
+        if self._client is None:
+            self._client = self.ollama_module.Client(host=OLLAMA_URL, **self._pool_options())
+        return self._client
+
+    def _pool_options(self):
+        """httpx pool limits for the ollama clients: keep a connection alive per in-flight call"""
+        try:
+            import httpx
+        except ImportError:
+            return {}
+        connections = max(self.max_inflight, 1) * 4
+        return {"limits": httpx.Limits(max_connections=connections, max_keepalive_connections=connections)}
+
+    def _client_for(self, kwargs):
+        """Pick a client whose HTTP timeout covers options['timeout'] (ms).
+
+        Ollama ignores a timeout option, so it is removed from the request and
+        enforced client-side. Timeouts are rounded up to a power of two seconds
+        to keep the number of pooled clients small.
+        """
+        options = kwargs.get("options")
+        if not options or "timeout" not in options:
+            return self.client
+        options = dict(options)
+        timeout_ms = options.pop("timeout")
+        kwargs["options"] = options
+        seconds = 1 << max(0, math.ceil(math.log2(max(timeout_ms, 1) / 1000)))
+        client = self._clients.get(seconds)
+        if client is None:
+            client = self._clients[seconds] = self.ollama_module.Client(
+                host=OLLAMA_URL, timeout=seconds, **self._pool_options()
+            )
+        return client
         
+    def embed(self, model, text):
+        """Return the embedding vector for one piece of text"""
+        if not self.ollama_ready:
+            if not self.initialize_ollama():
+                raise OllamaUnavailableError("Ollama service not ready")
+        response = self.client.embed(model=model, input=text, keep_alive=self.keep_alive)
+        return response["embeddings"][0]
+
+    def chat_stream(self, *args, **kwargs):
+        """Yield message content deltas from a streamed ollama.chat call"""
+        if not self.ollama_ready:
+            if not self.initialize_ollama():
+                raise OllamaUnavailableError("Ollama service not ready")
+        kwargs.setdefault("keep_alive", self.keep_alive)
+        client = self._client_for(kwargs)
+        # The slot is held until the stream is consumed or closed
+        with self._inflight:
+            for chunk in client.chat(*args, stream=True, **kwargs):
+                content = chunk["message"]["content"]
+                if content:
+                    yield content
+
+    def close(self):
+        """Release pooled HTTP connections"""
+        self.session.close()
+        for client in [self._client, *self._clients.values()]:
+            http = getattr(client, "_client", None)
+            if http is not None:
+                http.close()
+        self._client = None
+        self._clients = {}
+
     def verify_model(self, model_name):
-        """Verify if a specific model is available"""
+        """Verify if a specific model is available without loading it"""
+        if not self.ollama_ready:
+            return False
+        key = model_key(model_name)
         try:
-            if not self.ollama_ready:
-                return False
-                
-            response = self.chat(
-                model=model_name, 
-                messages=[{"role": "user", "content": "test"}],
-                options={"timeout": 5000}
-            )
-            return True
-        except Exception as e:
+            # One GET lists every installed model; concurrent checks share it for a while
+            with self._available_lock:
+                if self._available is None or time.monotonic() - self._available_at > AVAILABLE_MODELS_TTL_SEC:
+                    self.refresh_available_models()
+            if key in self._available:
+                return True
+            # The cached list may predate a pull; /api/show answers from metadata only
+            response = self.session.post(f"{OLLAMA_URL}/api/show", json={"model": model_name}, timeout=2)
+        except requests.exceptions.ConnectionError:
+            raise OllamaUnavailableError("Cannot connect to Ollama service")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Could not verify model {model_name}: {e}")
             return False
+        if response.status_code == 200:
+            self._available.add(key)
+            return True
+        return False
+
+def model_key(model_name):
+    """Normalize a model name the way Ollama does, defaulting the tag to latest"""
+    return model_name if ":" in model_name else f"{model_name}:latest"
 
 class OllamaError(Exception):
     """Custom exception for Ollama-related errors."""
     pass
+
+class OllamaUnavailableError(OllamaError, ConnectionError):
+    """The Ollama service itself could not be reached."""
@@ -1,59 +1,253 @@
+import ast
+import asyncio
+import atexit
 import logging
-from typing import Any, Callable, Dict, List, Optional
+import math
+import operator
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
-from config import DEFAULT_MODE, FALLBACK_ORDER, MODEL_CALL_TIMEOUT_MS, OLLAMA_MODELS, PROGRESS_MESSAGES
-from ollama_service_manager import OllamaError
+from config import (
+    DEFAULT_MODE,
+    FALLBACK_ORDER,
+    IN_PROCESS_MAX_PROMPT_CHARS,
+    IN_PROCESS_MODELS,
+    MODEL_CALL_TIMEOUT_FLOOR_MS,
+    MODEL_CALL_TIMEOUT_MS,
+    OLLAMA_MODELS,
+    PRELOAD_PIPELINE_MODELS,
+    PROGRESS_MESSAGES,
+    SEMANTIC_CACHE_MODEL,
+    SEMANTIC_CACHE_THRESHOLD,
+    SPECULATIVE_DRAFT_TOKENS,
+    STAGE_MEMO_SIZE,
+)
+import json_utils
+import llm_cache
+from in_process_model_manager import InProcessModelManager
+import model_pool
+from model_pool import ModelPool
+from ollama_service_manager import OllamaError, model_key
+from semantic_cache import SemanticCache
+
+if TYPE_CHECKING:
+    from main import ApplicationState
 
 logger = logging.getLogger("prompt_enhancer")
 
-def retry_with_fallback(func: Callable, *args: Any, max_retries: int = 2, model_name: Optional[str] = None, **kwargs: Any) -> Any:
-    """Retry a function with fallback models if the primary model fails."""
-    last_error = None
-    model_arg_index = -1
-
-    if model_name is None:
-        for i, arg in enumerate(args):
-            if isinstance(arg, str) and arg in OLLAMA_MODELS.values():
-                model_arg_index = i
-                model_name = arg
-                break
-    else:
-        for i, arg in enumerate(args):
-            if isinstance(arg, str) and arg == model_name:
-                model_arg_index = i
-                break
+_SECTION_DELIMITER_RE = re.compile(r"^\s*---\s*$", re.MULTILINE)
 
-    if model_name is None or model_arg_index == -1:
-        raise ValueError("No model argument found")
+# Static stage instructions sent as the first (system) message so every call
+# to a stage shares a byte-identical prefix that Ollama can keep in KV cache;
+# only the dynamic content goes in the user turn.
+SYSTEM_PROMPTS: Dict[str, Dict[str, str]] = {
+    "analysis": {
+        "role": "system",
+        "content": (
+            "Analyze the prompt you are given.\n\n"
+            "Focus on:\n"
+            "1. Core requirements and goals\n"
+            "2. Key components needed\n"
+            "3. Specific constraints or parameters\n"
+            "4. Expected output format\n"
+            "5. Quality criteria\n\n"
+            "Provide a clear, focused analysis that will help in "
+            "improving this exact prompt."
+        ),
+    },
+    "generation": {
+        "role": "system",
+        "content": (
+            "Based on the analysis you are given, generate specific improvements that:\n"
+            "1. Address identified issues\n"
+            "2. Enhance clarity and specificity\n"
+            "3. Add necessary structure\n"
+            "4. Maintain focus on core goals\n"
+            "5. Consider all quality criteria\n\n"
+            "Important: Generate practical, focused improvements "
+            "that directly enhance the prompt."
+        ),
+    },
+    "vetting": {
+        "role": "system",
+        "content": (
+            "Review the suggested improvements you are given and evaluate how "
+            "well they enhance the original prompt:\n"
+            "1. Do they address core requirements?\n"
+            "2. Are they clear and specific?\n"
+            "3. Do they maintain focus on the task?\n"
+            "4. Are they practical and implementable?\n\n"
+            "Important: Focus on validating improvements that "
+            "directly enhance the original prompt."
+        ),
+    },
+    "finalization": {
+        "role": "system",
+        "content": (
+            "Given an original prompt and validated improvements, create an "
+            "improved version that:\n"
+            "1. Maintains the original goal\n"
+            "2. Incorporates validated improvements\n"
+            "3. Uses clear, specific language\n"
+            "4. Adds necessary structure\n"
+            "5. Includes any required constraints\n\n"
+            "Important: Stay focused on the original task."
+        ),
+    },
+    "vet_and_finalize": {
+        "role": "system",
+        "content": (
+            "Given an original prompt and suggested improvements:\n\n"
+            "Step A - Review the suggested improvements:\n"
+            "1. Do they address core requirements?\n"
+            "2. Are they clear and specific?\n"
+            "3. Do they maintain focus on the task?\n"
+            "4. Are they practical and implementable?\n\n"
+            "Step B - Create an improved version of the original prompt that:\n"
+            "1. Maintains the original goal\n"
+            "2. Incorporates the validated improvements\n"
+            "3. Uses clear, specific language\n"
+            "4. Adds necessary structure\n"
+            "5. Includes any required constraints\n\n"
+            "Write the Step A review, then a line containing only '---', "
+            "then the Step B prompt."
+        ),
+    },
+    "enhancement": {
+        "role": "system",
+        "content": (
+            "Polish and refine the prompt you are given.\n\n"
+            "Focus on:\n"
+            "1. Making instructions crystal clear\n"
+            "2. Adding any missing details\n"
+            "3. Improving structure\n"
+            "4. Ensuring completeness\n"
+            "5. Maintaining focus\n\n"
+            "Important: Stay focused on improving THIS prompt."
+        ),
+    },
+    "comprehensive": {
+        "role": "system",
+        "content": (
+            "Review all versions of the prompt you are given and create an "
+            "improved version that combines the best elements. Create a "
+            "refined version that maintains the core intent while maximizing "
+            "clarity and effectiveness."
+        ),
+    },
+    "presenter": {
+        "role": "system",
+        "content": (
+            "You are the final presenter. Clean up the prompt you are given "
+            "for presentation.\n\n"
+            "Requirements:\n"
+            "1. Remove any markdown formatting\n"
+            "2. Remove any meta-commentary\n"
+            "3. Remove any section headers\n"
+            "4. Present as clean paragraphs\n"
+            "5. Maintain all important content\n\n"
+            "Start your response with 'PRESENT TO USER:' followed "
+            "by the final, clean prompt."
+        ),
+    },
+    "presenter_json": {
+        "role": "system",
+        "content": (
+            "You are the final presenter. Clean up the prompt you are given "
+            "for presentation.\n\n"
+            "Requirements:\n"
+            "1. Remove any markdown formatting\n"
+            "2. Remove any meta-commentary\n"
+            "3. Remove any section headers\n"
+            "4. Present as clean paragraphs\n"
+            "5. Maintain all important content\n\n"
+            'Respond with JSON only: {"prompt": "<the final, clean prompt>"}'
+        ),
+    },
+    "solve": {
+        "role": "system",
+        "content": (
+            "You are a precise solver. Follow the problem instructions and "
+            "return ONLY the final answer in the required format. Do not restate "
+            "the problem and do not add explanations."
+        ),
+    },
+    "verify": {
+        "role": "system",
+        "content": (
+            "Verify the proposed answer against the problem. If incorrect, "
+            "produce the corrected answer. Return ONLY the final answer in the "
+            "required format with no explanation."
+        ),
+    },
+}
 
-    args_list = list(args)
+_in_process_manager = InProcessModelManager(IN_PROCESS_MODELS, draft_tokens=SPECULATIVE_DRAFT_TOKENS)
 
-    for _ in range(max_retries):
-        try:
-            return func(*args_list, **kwargs)
-        except Exception as e:
-            last_error = e
-            logger.warning(f"Error with model {model_name}: {e}")
+_semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_cache.npz"),
+) if SEMANTIC_CACHE_MODEL and SemanticCache.available() else None
 
-    for fallback_model in FALLBACK_ORDER.get(model_name, []):
-        args_list[model_arg_index] = fallback_model
-        try:
-            logger.info(f"Trying fallback model: {fallback_model}")
-            return func(*args_list, **kwargs)
-        except Exception as e:
-            last_error = e
-            logger.warning(f"Error with fallback model {fallback_model}: {e}")
+_pools: Dict[str, ModelPool] = {}
 
-    raise last_error or Exception("All models failed")
+def _pool(model_name: str) -> ModelPool:
+    """Return the (cached) fallback pool for a primary model."""
+    pool = _pools.get(model_name)
+    if pool is None:
+        pool = _pools[model_name] = ModelPool(model_name, FALLBACK_ORDER.get(model_name, []))
+    return pool
+
+_REFLECTION_INSTRUCTIONS = {
+    "role": "system",
+    "content": (
+        "Answer the request above in three steps: write a draft; critique the "
+        "draft for completeness, accuracy, clarity, structure and relevance; then "
+        "write an improved final answer that fixes every weakness. Respond with "
+        'JSON only: {"draft": "...", "critique": "...", "final": "..."}'
+    ),
+}
+
+_CRITIQUE_INSTRUCTIONS = {
+    "role": "system",
+    "content": (
+        "Critique the previous response for completeness, accuracy, clarity, "
+        "structure, relevance. Identify weaknesses and suggest improvements."
+    ),
+}
 
 def generate_with_reflection(model_name: str, base_messages: List[Dict], options: Optional[Dict] = None) -> str:
-    """Generate with self-reflection to boost weak LLMs."""
+    """Generate with self-reflection to boost weak LLMs.
+
+    Draft, critique and revision come back in one JSON response; when the
+    model doesn't produce valid JSON the three-call version is used instead.
+    """
+    messages = base_messages + [_REFLECTION_INSTRUCTIONS]
+    response = _chat(model_name, messages, {"temperature": 0, **(options or {})}, response_format="json")
+    try:
+        final = json_utils.loads(response["message"]["content"])["final"]
+        if isinstance(final, str) and final.strip():
+            return final
+    except (ValueError, KeyError, TypeError):
+        pass
+    logger.warning(f"Reflection JSON from {model_name} was invalid; using separate calls")
+    return _generate_with_reflection_calls(model_name, base_messages, options)
+
+def _generate_with_reflection_calls(model_name: str, base_messages: List[Dict], options: Optional[Dict] = None) -> str:
+    """Draft, critique and improve as three sequential calls."""
     response = _chat(model_name, base_messages, options)
     content = response["message"]["content"]
 
     critique_messages = base_messages + [
         {"role": "assistant", "content": content},
-        {"role": "system", "content": "Critique the previous response for completeness, accuracy, clarity, structure, relevance. Identify weaknesses and suggest improvements."},
+        _CRITIQUE_INSTRUCTIONS,
         {"role": "user", "content": "Provide critique."}
     ]
     critique = _chat(model_name, critique_messages, options)["message"]["content"]
@@ -64,205 +258,435 @@ def generate_with_reflection(model_name: str, base_messages: List[Dict], options
     ]
     return _chat(model_name, improve_messages, options)["message"]["content"]
 
-def _chat(model_name: str, messages: List[Dict], options: Optional[Dict] = None) -> Dict:
-    from main import app_state
-    if app_state.settings_manager is None:
-        from settings_manager import SettingsManager
-        app_state.settings_manager = SettingsManager()
-    if app_state.ollama_manager is None:
-        from ollama_service_manager import OllamaServiceManager
-        app_state.ollama_manager = OllamaServiceManager(app_state)
+def _use_in_process(model_name: str, messages: List[Dict]) -> bool:
+    """Short prompts on locally configured GGUF models skip the Ollama HTTP hop."""
+    if not _in_process_manager.has_model(model_name):
+        return False
+    return sum(len(m.get("content", "")) for m in messages) <= IN_PROCESS_MAX_PROMPT_CHARS
+
+_app_state: Optional["ApplicationState"] = None
+
+def _get_state() -> "ApplicationState":
+    """Return main.app_state, importing it on first use (main imports this module)."""
+    global _app_state
+    if _app_state is None:
+        from main import app_state
+        _app_state = app_state
+    return _app_state
+
+_manager = None
+_manager_lock = threading.Lock()
 
-    opts = {"timeout": MODEL_CALL_TIMEOUT_MS}
+def _ensure_managers():
+    """Create the settings and Ollama managers and the disk cache, once per process."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            app_state = _get_state()
+            if app_state.settings_manager is None:
+                from settings_manager import SettingsManager
+                app_state.settings_manager = SettingsManager()
+            if app_state.ollama_manager is None:
+                from ollama_service_manager import OllamaServiceManager
+                app_state.ollama_manager = OllamaServiceManager(app_state)
+            # Deterministic (temperature 0) responses survive restarts on disk,
+            # in the GUI, the API process and standalone api.py alike
+            llm_cache.attach_disk_cache(
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.db"),
+                app_state.settings_manager.get("response_cache_ttl", 7 * 24 * 3600)
+            )
+            atexit.register(llm_cache.close_disk_cache)
+            _manager = app_state.ollama_manager
+    return _manager
+
+def _ollama_manager():
+    """Return the shared Ollama manager, bootstrapping it on first use."""
+    return _manager if _manager is not None else _ensure_managers()
+
+# Receives content deltas while a pipeline stage streams; None means no streaming.
+# A None delta means the attempt failed and the text streamed so far is void.
+_stream_sink: ContextVar[Optional[Callable[[Optional[str]], None]]] = ContextVar("_stream_sink", default=None)
+
+@contextmanager
+def _streaming(sink: Optional[Callable[[Optional[str]], None]]):
+    """Route _chat deltas to ``sink`` (or stop streaming with None) for a block."""
+    token = _stream_sink.set(sink)
+    try:
+        yield
+    finally:
+        _stream_sink.reset(token)
+
+def _chat(
+    model_name: str,
+    messages: List[Dict],
+    options: Optional[Dict] = None,
+    response_format: Optional[str] = None
+) -> Dict:
+    # Ollama samples at a non-zero temperature by default, so only explicit
+    # temperature-0 requests are deterministic enough to replay from cache.
+    cacheable = bool(options) and options.get("temperature") == 0
+    if cacheable:
+        key = llm_cache.cache_key(model_name, messages, {**options, "format": response_format})
+        content = llm_cache.response_cache.get(key)
+        if content is not None:
+            sink = _stream_sink.get()
+            if sink is not None:
+                sink(content)
+            return {"message": {"content": content}}
+
+    response = _dispatch_chat(model_name, messages, options, response_format)
+    if cacheable:
+        llm_cache.response_cache.set(key, response["message"]["content"])
+    return response
+
+def _dispatch_chat(
+    model_name: str,
+    messages: List[Dict],
+    options: Optional[Dict] = None,
+    response_format: Optional[str] = None
+) -> Dict:
+    if _use_in_process(model_name, messages):
+        try:
+            return _in_process_manager.chat(model_name, messages, options, response_format)
+        except ImportError:
+            logger.warning("llama-cpp-python is not installed; using Ollama")
+            _in_process_manager.model_paths.clear()
+
+    opts = {
+        "timeout": model_pool.timeout_for(model_name, MODEL_CALL_TIMEOUT_FLOOR_MS, MODEL_CALL_TIMEOUT_MS)
+    }
     if options:
         opts.update(options)
-    return app_state.ollama_manager.chat(
-        model=model_name,
-        messages=messages,
-        options=opts
-    )
+    # Only pass format when set, so managers without it keep working
+    extra = {"format": response_format} if response_format else {}
+    breaker = model_pool.service_breaker
+    if not breaker.allow():
+        raise OllamaError("Ollama circuit open")
+    started = time.perf_counter()
+    sink = _stream_sink.get()
+    parts = []
+    try:
+        if sink is not None:
+            for delta in _ollama_manager().chat_stream(model=model_name, messages=messages, options=opts, **extra):
+                parts.append(delta)
+                sink(delta)
+            response = {"message": {"content": "".join(parts)}}
+        else:
+            response = _ollama_manager().chat(
+                model=model_name,
+                messages=messages,
+                options=opts,
+                **extra
+            )
+    except Exception as e:
+        if model_pool.is_timeout(e):
+            model_pool.record_timeout(model_name)
+        if model_pool.is_service_failure(e):
+            breaker.record_failure()
+        else:
+            # The server answered, even if this model could not; that also
+            # settles a half-open probe
+            breaker.record_success()
+        if parts:
+            # Whatever streamed before the failure is superseded by the retry
+            sink(None)
+        raise
+    breaker.record_success()
+    model_pool.record_latency(model_name, time.perf_counter() - started)
+    return response
+
+def _prefetch_model(model_name: str) -> None:
+    """Ask Ollama to load a model in the background ahead of its stage."""
+    if _in_process_manager.has_model(model_name):
+        return
+    try:
+        _ollama_manager().preload(model_name)
+    except Exception as e:
+        logger.warning(f"Model prefetch failed for {model_name}: {e}")
+
+def _warm_models(models: Iterable[str]) -> None:
+    """Start loading every distinct model a run will use, in stage order."""
+    if not PRELOAD_PIPELINE_MODELS:
+        return
+    for model_name in dict.fromkeys(models):
+        _prefetch_model(model_name)
+
+_ARITHMETIC_RE = re.compile(r"[\d\s+\-*/().=]+")
+# Longer expressions are left to the models rather than parsed: the AST and
+# the evaluator both recurse once per operator
+_ARITHMETIC_MAX_CHARS = 200
+
+_ARITHMETIC_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+def _evaluate_arithmetic(prompt: str) -> Optional[str]:
+    """Answer a bare arithmetic expression like '2 + 2 =' without a model call."""
+    text = (prompt or "").strip().rstrip("=").strip()
+    if (not text or len(text) > _ARITHMETIC_MAX_CHARS
+            or not _ARITHMETIC_RE.fullmatch(text) or "=" in text):
+        return None
+
+    def evaluate(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC_OPS:
+            return _ARITHMETIC_OPS[type(node.op)](evaluate(node.left), evaluate(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _ARITHMETIC_OPS:
+            return _ARITHMETIC_OPS[type(node.op)](evaluate(node.operand))
+        raise ValueError("unsupported expression")
+
+    try:
+        tree = ast.parse(text, mode="eval").body
+        # A bare number is not a question; leave it to the models
+        if not any(isinstance(node, ast.BinOp) for node in ast.walk(tree)):
+            return None
+        value = evaluate(tree)
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return None
+            if value.is_integer():
+                value = int(value)
+        # str() of a huge int raises ValueError past sys.get_int_max_str_digits()
+        return str(value)
+    except (SyntaxError, ValueError, ZeroDivisionError, OverflowError, RecursionError, MemoryError):
+        return None
+
+_SOLVE_CUES_RE = re.compile(
+    r"return only|output format|exactly the sample output|answer key|final answers",
+    re.IGNORECASE,
+)
 
 def _should_solve(prompt: str) -> bool:
-    text = (prompt or "").lower()
-    cues = [
-        "return only",
-        "output format",
-        "exactly the sample output",
-        "answer key",
-        "final answers",
-    ]
-    return any(cue in text for cue in cues)
+    return bool(_SOLVE_CUES_RE.search(prompt or ""))
+
+def _ollama_stage(label: str) -> Callable:
+    """Log a stage's failure and re-raise it as OllamaError("<label> failed: ...")."""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Error during {label.lower()}: {e}")
+                raise OllamaError(f"{label} failed: {str(e)}") from e
+        return wrapper
+    return decorator
 
+@_ollama_stage("Solve")
 def solve_problem(prompt: str, model_name: str) -> str:
     """Solve a problem and return only the final answer."""
     messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a precise solver. Follow the problem instructions and "
-                "return ONLY the final answer in the required format. Do not restate "
-                "the problem and do not add explanations."
-            ),
-        },
-        {
-            "role": "user",
-            "content": prompt,
-        },
+        SYSTEM_PROMPTS["solve"],
+        {"role": "user", "content": prompt},
     ]
-    try:
-        response = _chat(model_name, messages, options={"temperature": 0})
-        return response["message"]["content"]
-    except Exception as e:
-        logger.error(f"Error during solve: {e}")
-        raise OllamaError(f"Solve failed: {str(e)}")
+    response = _chat(model_name, messages, options={"temperature": 0})
+    return response["message"]["content"]
 
+@_ollama_stage("Verify")
 def verify_answer(prompt: str, answer: str, model_name: str) -> str:
     """Verify and correct the answer, returning only the final answer."""
     messages = [
-        {
-            "role": "system",
-            "content": (
-                "Verify the proposed answer against the problem. If incorrect, "
-                "produce the corrected answer. Return ONLY the final answer in the "
-                "required format with no explanation."
-            ),
-        },
-        {
-            "role": "user",
-            "content": f"Problem:\n{prompt}\n\nProposed answer:\n{answer}",
-        },
+        SYSTEM_PROMPTS["verify"],
+        {"role": "user", "content": f"Problem:\n{prompt}\n\nProposed answer:\n{answer}"},
     ]
+    response = _chat(model_name, messages, options={"temperature": 0})
+    return response["message"]["content"]
+
+def _embed_for_cache(text: str) -> Optional[List[float]]:
+    """Embed text for the semantic cache, or None when the cache is disabled."""
+    if _semantic_cache is None:
+        return None
     try:
-        response = _chat(model_name, messages, options={"temperature": 0})
-        return response["message"]["content"]
+        return _ollama_manager().embed(SEMANTIC_CACHE_MODEL, text)
     except Exception as e:
-        logger.error(f"Error during verify: {e}")
-        raise OllamaError(f"Verify failed: {str(e)}")
+        logger.warning(f"Embedding for semantic cache failed: {e}")
+        return None
+
+class Stage(NamedTuple):
+    """A single-call pipeline stage: its system prompt and user-turn template."""
+    name: str
+    label: str
+    template: str
 
-def analyze_prompt(prompt: str, model_name: str) -> str:
+# Single-call stages, keyed by the SYSTEM_PROMPTS entry they send
+STAGES: Dict[str, Stage] = {
+    stage.name: stage for stage in (
+        Stage("analysis", "Analysis", "Analyze this prompt: '{prompt}'"),
+        Stage("generation", "Solution generation", "Analysis: '{analysis}'"),
+        Stage("vetting", "Vetting", "Suggested improvements: '{improvements}'"),
+        Stage("finalization", "Finalization", "Original Prompt: {prompt}\nValidated Improvements: {vetting}"),
+        Stage("enhancement", "Enhancement", "{final}"),
+    )
+}
+
+def _reply(model_name: str, messages: List[Dict]) -> str:
+    return _chat(model_name, messages)["message"]["content"]
+
+# Each stage's chat call, wrapped once with that stage's error label
+_STAGE_REPLIES: Dict[str, Callable[[str, List[Dict]], str]] = {
+    name: _ollama_stage(stage.label)(_reply) for name, stage in STAGES.items()
+}
+
+# Each stage memoizes its own replies, keyed by model and the full request
+_STAGE_MEMOS: Dict[str, llm_cache.ResponseCache] = {
+    name: llm_cache.ResponseCache(STAGE_MEMO_SIZE) for name in (*STAGES, "comprehensive")
+}
+
+def _stage_messages(stage: Stage, conversation: Optional[List[Dict]], **context: str) -> List[Dict]:
+    content = stage.template.format(**context)
+    if conversation:
+        return conversation + [{
+            "role": "user",
+            "content": f"{SYSTEM_PROMPTS[stage.name]['content']}\n\n{content}",
+        }]
+    return [SYSTEM_PROMPTS[stage.name], {"role": "user", "content": content}]
+
+def _extend_conversation(conversation: Optional[List[Dict]], messages: List[Dict], reply: str) -> None:
+    if conversation is not None:
+        conversation[:] = messages + [{"role": "assistant", "content": reply}]
+
+def _run_stage(stage: Stage, model_name: str, conversation: Optional[List[Dict]] = None, **context: str) -> str:
+    """Run one table-driven stage and return the model's reply.
+
+    A non-empty ``conversation`` (earlier turns with the same model) is
+    continued so Ollama reuses its cached prefix; the stage's instructions
+    then travel in the user turn. The conversation is part of the memo key,
+    and on success, memoized or not, it is extended with this turn and the
+    reply.
+    """
+    messages = _stage_messages(stage, conversation, **context)
+    memo = _STAGE_MEMOS[stage.name]
+    key = llm_cache.cache_key(model_name, messages)
+    reply = memo.get(key)
+    if reply is None:
+        reply = _STAGE_REPLIES[stage.name](model_name, messages)
+        memo.set(key, reply)
+    _extend_conversation(conversation, messages, reply)
+    return reply
+
+def analyze_prompt(prompt: str, model_name: str, conversation: Optional[List[Dict]] = None) -> str:
     """Analyze the initial prompt."""
-    messages = [
-        {
-            "role": "user", 
-            "content": (
-                f"Analyze this prompt: '{prompt}'\n\n"
-                "Focus on:\n"
-                "1. Core requirements and goals\n"
-                "2. Key components needed\n"
-                "3. Specific constraints or parameters\n"
-                "4. Expected output format\n"
-                "5. Quality criteria\n\n"
-                "Provide a clear, focused analysis that will help in "
-                "improving this exact prompt."
-            )
-        }
-    ]
-    try:
-        response = _chat(model_name, messages)
-        return response["message"]["content"]
-    except Exception as e:
-        logger.error(f"Error during analysis: {e}")
-        raise OllamaError(f"Analysis failed: {str(e)}")
+    stage = STAGES["analysis"]
+    vector = _embed_for_cache(prompt)
+    if vector is not None:
+        cached = _semantic_cache.lookup(vector)
+        if cached is not None:
+            logger.info("Semantic cache hit for analysis")
+            _extend_conversation(conversation, _stage_messages(stage, conversation, prompt=prompt), cached)
+            return cached
+    content = _run_stage(stage, model_name, conversation, prompt=prompt)
+    if vector is not None:
+        _semantic_cache.add(vector, content)
+    return content
 
-def generate_solutions(analysis: str, model_name: str) -> str:
+def generate_solutions(analysis: str, model_name: str, conversation: Optional[List[Dict]] = None) -> str:
     """Generate potential improvements based on analysis."""
-    messages = [
-        {
-            "role": "user",
-            "content": (
-                f"Based on this analysis: '{analysis}'\n\n"
-                "Generate specific improvements that:\n"
-                "1. Address identified issues\n"
-                "2. Enhance clarity and specificity\n"
-                "3. Add necessary structure\n"
-                "4. Maintain focus on core goals\n"
-                "5. Consider all quality criteria\n\n"
-                "Important: Generate practical, focused improvements "
-                "that directly enhance the prompt."
-            )
-        }
-    ]
-    try:
-        response = _chat(model_name, messages)
-        return response["message"]["content"]
-    except Exception as e:
-        logger.error(f"Error during solution generation: {e}")
-        raise OllamaError(f"Solution generation failed: {str(e)}")
+    return _run_stage(STAGES["generation"], model_name, conversation, analysis=analysis)
 
-def vet_and_refine(improvements: str, model_name: str) -> str:
+def vet_and_refine(improvements: str, model_name: str, conversation: Optional[List[Dict]] = None) -> str:
     """Review and validate the suggested improvements."""
-    messages = [
-        {
-            "role": "user",
-            "content": (
-                f"Review these suggested improvements: '{improvements}'\n\n"
-                "Evaluate how well they enhance the original prompt:\n"
-                "1. Do they address core requirements?\n"
-                "2. Are they clear and specific?\n"
-                "3. Do they maintain focus on the task?\n"
-                "4. Are they practical and implementable?\n\n"
-                "Important: Focus on validating improvements that "
-                "directly enhance the original prompt."
-            )
-        }
-    ]
-    try:
-        response = _chat(model_name, messages)
-        return response["message"]["content"]
-    except Exception as e:
-        logger.error(f"Error during vetting: {e}")
-        raise OllamaError(f"Vetting failed: {str(e)}")
+    return _run_stage(STAGES["vetting"], model_name, conversation, improvements=improvements)
 
-def finalize_prompt(vetting_report: str, original_prompt: str, model_name: str) -> str:
+def finalize_prompt(
+    vetting_report: str, original_prompt: str, model_name: str,
+    conversation: Optional[List[Dict]] = None
+) -> str:
     """Create improved version incorporating validated enhancements."""
+    return _run_stage(
+        STAGES["finalization"], model_name, conversation, prompt=original_prompt, vetting=vetting_report
+    )
+
+def _enhance_messages(final_prompt: str) -> List[Dict]:
+    return [
+        SYSTEM_PROMPTS["enhancement"],
+        {"role": "user", "content": final_prompt},
+    ]
+
+def _split_sections(text: str) -> Tuple[str, str]:
+    """Split a two-section response on its '---' delimiter line."""
+    parts = _SECTION_DELIMITER_RE.split(text, maxsplit=1)
+    if len(parts) < 2:
+        return "", text.strip()
+    return parts[0].strip(), parts[1].strip()
+
+class _SectionStream:
+    """Route streamed deltas of a two-section response to one sink per section.
+
+    Text is forwarded a line at a time until the '---' delimiter line is seen,
+    then ``on_split`` receives the first section and every later delta goes
+    straight to ``after``.
+    """
+    def __init__(self, before: Callable[[Optional[str]], None], after: Callable[[Optional[str]], None],
+                 on_split: Callable[[str], None]):
+        self.before = before
+        self.after = after
+        self.on_split = on_split
+        self.split = False
+        self._buffer = ""
+        self._first: List[str] = []
+
+    def feed(self, delta: Optional[str]) -> None:
+        if delta is None:
+            # The attempt failed: void both sections and expect a fresh stream
+            if self.split:
+                self.after(None)
+            self.before(None)
+            self.split, self._buffer, self._first = False, "", []
+            return
+        if self.split:
+            self.after(delta)
+            return
+        self._buffer += delta
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            if _SECTION_DELIMITER_RE.fullmatch(line):
+                self.split = True
+                self.on_split("".join(self._first).strip())
+                rest, self._buffer = self._buffer.lstrip("\n"), ""
+                if rest:
+                    self.after(rest)
+                return
+            self._first.append(line + "\n")
+            self.before(line + "\n")
+
+    def finish(self) -> None:
+        """Flush a trailing partial line when no delimiter ever arrived."""
+        if not self.split and self._buffer:
+            self.before(self._buffer)
+            self._buffer = ""
+
+@_ollama_stage("Vetting/finalization")
+def vet_and_finalize(improvements: str, original_prompt: str, model_name: str) -> Tuple[str, str]:
+    """Vet the improvements and write the improved prompt in a single call."""
     messages = [
+        SYSTEM_PROMPTS["vet_and_finalize"],
         {
             "role": "user",
             "content": (
                 f"Original Prompt: {original_prompt}\n"
-                f"Validated Improvements: {vetting_report}\n\n"
-                "Create an improved version that:\n"
-                "1. Maintains the original goal\n"
-                "2. Incorporates validated improvements\n"
-                "3. Uses clear, specific language\n"
-                "4. Adds necessary structure\n"
-                "5. Includes any required constraints\n\n"
-                "Important: Stay focused on the original task."
-            )
-        }
+                f"Suggested Improvements: {improvements}"
+            ),
+        },
     ]
-    try:
-        response = _chat(model_name, messages)
-        return response["message"]["content"]
-    except Exception as e:
-        logger.error(f"Error during finalization: {e}")
-        raise OllamaError(f"Finalization failed: {str(e)}")
+    response = _chat(model_name, messages)
+    return _split_sections(response["message"]["content"])
 
-def enhance_prompt(final_prompt: str, model_name: str) -> str:
+def enhance_prompt(final_prompt: str, model_name: str, conversation: Optional[List[Dict]] = None) -> str:
     """Refine and polish the improved prompt."""
-    messages = [
-        {
-            "role": "user",
-            "content": (
-                "Polish and refine this prompt:\n\n"
-                f"{final_prompt}\n\n"
-                "Focus on:\n"
-                "1. Making instructions crystal clear\n"
-                "2. Adding any missing details\n"
-                "3. Improving structure\n"
-                "4. Ensuring completeness\n"
-                "5. Maintaining focus\n\n"
-                "Important: Stay focused on improving THIS prompt."
-            )
-        }
-    ]
-    try:
-        response = _chat(model_name, messages)
-        return response["message"]["content"]
-    except Exception as e:
-        logger.error(f"Error during enhancement: {e}")
-        raise OllamaError(f"Enhancement failed: {str(e)}")
+    return _run_stage(STAGES["enhancement"], model_name, conversation, final=final_prompt)
 
+# Stage functions that accept a ``conversation`` to continue
+_CONVERSATION_STAGES = frozenset((
+    analyze_prompt, generate_solutions, vet_and_refine, finalize_prompt, enhance_prompt
+))
+
+@_ollama_stage("Comprehensive review")
 def comprehensive_review(
     original_prompt: str,
     analysis_report: str,
@@ -270,106 +694,118 @@ def comprehensive_review(
     vetting_report: str,
     final_prompt: str,
     enhanced_prompt: str,
-    model_name: str
+    model_name: str,
+    prior_messages: Optional[List[Dict]] = None
 ) -> str:
-    """Create final version and ensure clean presentation."""
-    try:
-        # First, use model for comprehensive review
-        messages = [
-            {
-                "role": "user",
-                "content": (
-                    "Review all versions of this prompt and create an "
-                    "improved version that combines the best elements:\n\n"
-                    f"Original: {original_prompt}\n"
-                    f"Analysis: {analysis_report}\n"
-                    f"Solutions: {solutions}\n"
-                    f"Vetting: {vetting_report}\n"
-                    f"Final: {final_prompt}\n"
-                    f"Enhanced: {enhanced_prompt}\n\n"
-                    "Create a refined version that maintains the core "
-                    "intent while maximizing clarity and effectiveness."
-                )
-            }
-        ]
-        response = _chat(model_name, messages)
-        improved = response["message"]["content"]
+    """Create final version and ensure clean presentation.
 
-        # Then use presenter model for final cleanup
+    ``prior_messages`` continues an earlier conversation with the same model so
+    Ollama can reuse the already-evaluated prefix instead of re-prefilling it.
+    """
+    # First, use model for comprehensive review
+    versions = (
+        f"Original: {original_prompt}\n"
+        f"Analysis: {analysis_report}\n"
+        f"Solutions: {solutions}\n"
+        f"Vetting: {vetting_report}\n"
+        f"Final: {final_prompt}\n"
+        f"Enhanced: {enhanced_prompt}"
+    )
+    if prior_messages:
+        # The continued conversation keeps its own system message, so the
+        # review instructions travel in this turn instead
+        messages = list(prior_messages) + [{
+            "role": "user",
+            "content": f"{SYSTEM_PROMPTS['comprehensive']['content']}\n\n{versions}",
+        }]
+    else:
         messages = [
-            {
-                "role": "user",
-                "content": (
-                    "You are the final presenter. Clean up this prompt "
-                    f"for presentation:\n\n{improved}\n\n"
-                    "Requirements:\n"
-                    "1. Remove any markdown formatting\n"
-                    "2. Remove any meta-commentary\n"
-                    "3. Remove any section headers\n"
-                    "4. Present as clean paragraphs\n"
-                    "5. Maintain all important content\n\n"
-                    "Start your response with 'PRESENT TO USER:' followed "
-                    "by the final, clean prompt."
-                )
-            }
+            SYSTEM_PROMPTS["comprehensive"],
+            {"role": "user", "content": versions},
         ]
-        
-        presenter_model = OLLAMA_MODELS.get("presenter", model_name)
-        response = _chat(presenter_model, messages)
-        return response["message"]["content"]
-    except Exception as e:
-        logger.error(f"Error during comprehensive review: {e}")
-        raise OllamaError(f"Comprehensive review failed: {str(e)}")
+    # Only the review call is memoized: the presenter's output depends on
+    # whether a sink is streaming it, so that call always runs
+    memo = _STAGE_MEMOS["comprehensive"]
+    key = llm_cache.cache_key(model_name, messages)
+    improved = memo.get(key)
+    if improved is None:
+        # Only the presenter's cleaned-up text is shown, so the review call
+        # doesn't stream; the presenter call below inherits the stage's sink
+        with _streaming(None):
+            improved = _chat(model_name, messages)["message"]["content"]
+        memo.set(key, improved)
 
-def verify_model_availability(model_name: str) -> bool:
-    """Verify if an Ollama model is available."""
+    # Then use presenter model for final cleanup
+    messages = [
+        SYSTEM_PROMPTS["presenter"],
+        {"role": "user", "content": improved},
+    ]
+
+    presenter_model = OLLAMA_MODELS.get("presenter", model_name)
+    if _stream_sink.get() is None:
+        # Nothing is streamed, so ask for structured output instead of
+        # parsing the 'PRESENT TO USER:' marker out of free text
+        presented = _present_json(presenter_model, improved)
+        if presented is not None:
+            return presented
+    response = _chat(presenter_model, messages)
+    return response["message"]["content"]
+
+def _present_json(model_name: str, improved: str) -> Optional[str]:
+    """Clean up the reviewed prompt as JSON {"prompt": ...}; None if the reply is unusable."""
+    messages = [
+        SYSTEM_PROMPTS["presenter_json"],
+        {"role": "user", "content": improved},
+    ]
+    response = _chat(model_name, messages, {"temperature": 0}, response_format="json")
     try:
-        from main import app_state
-        if not app_state.ollama_manager.ollama_ready:
-            return False
+        presented = json_utils.loads(response["message"]["content"])["prompt"]
+    except (ValueError, KeyError, TypeError):
+        presented = None
+    if isinstance(presented, str) and presented.strip():
+        return presented.strip()
+    logger.warning(f"Presenter JSON from {model_name} was invalid; using plain text")
+    return None
 
-        _chat(model_name, [{"role": "user", "content": "test"}], options={"timeout": 5000})
-        return True
-    except Exception as e:
-        error_str = str(e).lower()
-        if "connection" in error_str:
-            raise OllamaError("Cannot connect to Ollama service")
-        elif "timeout" in error_str:
-            raise OllamaError(f"Model {model_name} timed out")
-        else:
-            logger.error(f"Model {model_name} is not available: {str(e)}")
-            return False
+async def averify_model_availability(model_name: str) -> bool:
+    """Verify if an Ollama model is installed, from metadata rather than a test chat."""
+    manager = _ollama_manager()
+    if not manager.ollama_ready:
+        return False
+    # Raises OllamaError("Cannot connect ...") when the service is unreachable
+    return await asyncio.to_thread(manager.verify_model, model_name)
 
-def validate_models() -> List[tuple]:
-    """Validate all required models are available."""
-    from main import app_state
-    if app_state.settings_manager is None:
-        from settings_manager import SettingsManager
-        app_state.settings_manager = SettingsManager()
-    if app_state.ollama_manager is None:
-        from ollama_service_manager import OllamaServiceManager
-        app_state.ollama_manager = OllamaServiceManager(app_state)
-    
-    if not app_state.ollama_manager.ollama_ready:
+async def avalidate_models() -> List[tuple]:
+    """Validate all required models are available, probing them concurrently."""
+    if not _ollama_manager().ollama_ready:
         return []
-        
-    unavailable_models = []
-    connection_error = None
-    
-    for purpose, model in OLLAMA_MODELS.items():
-        try:
-            if not verify_model_availability(model):
-                unavailable_models.append((purpose, model))
-        except OllamaError as e:
-            if "Cannot connect" in str(e):
-                connection_error = str(e)
-                break
-            unavailable_models.append((purpose, model))
-    
-    if connection_error:
-        raise OllamaError(connection_error)
-        
-    return unavailable_models
+
+    # Several purposes often share one model, sometimes spelled with and
+    # without ":latest"; probe each distinct model once
+    unique: Dict[str, str] = {}
+    for model in OLLAMA_MODELS.values():
+        unique.setdefault(model_key(model), model)
+    outcomes = await asyncio.gather(
+        *(averify_model_availability(model) for model in unique.values()),
+        return_exceptions=True
+    )
+    for available in outcomes:
+        if isinstance(available, OllamaError) and "Cannot connect" in str(available):
+            raise available
+    availability = dict(zip(unique, outcomes))
+
+    return [
+        (purpose, model) for purpose, model in OLLAMA_MODELS.items()
+        if availability[model_key(model)] is not True
+    ]
+
+def verify_model_availability(model_name: str) -> bool:
+    """Synchronous wrapper around averify_model_availability."""
+    return asyncio.run(averify_model_availability(model_name))
+
+def validate_models() -> List[tuple]:
+    """Synchronous wrapper around avalidate_models."""
+    return asyncio.run(avalidate_models())
 
 
 def _emit_progress(progress_cb: Optional[Callable], phase: str, content: Optional[str] = None) -> None:
@@ -377,160 +813,278 @@ def _emit_progress(progress_cb: Optional[Callable], phase: str, content: Optiona
         progress_cb(phase, PROGRESS_MESSAGES.get(phase, ""), content)
 
 
+class _CallbackQueue:
+    """Run callbacks in submission order on one background thread.
+
+    Progress, result and stream callbacks share the queue, so a slow UI
+    callback never delays the next model call and output stays in order.
+    """
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[Optional[Tuple[Callable, tuple]]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, name="pipeline-callbacks", daemon=True)
+        self._thread.start()
+
+    def wrap(self, callback: Optional[Callable]) -> Optional[Callable]:
+        if callback is None:
+            return None
+        return lambda *args: self._queue.put((callback, args))
+
+    def close(self) -> None:
+        """Wait until every queued callback has run."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _drain(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            callback, args = item
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"Pipeline callback failed: {e}")
+
+
 def run_full_pipeline(
     prompt: str,
     progress_cb: Optional[Callable] = None,
-    mode: Optional[str] = None
+    mode: Optional[str] = None,
+    completed: Optional[Dict[str, str]] = None,
+    on_result: Optional[Callable[[str, str], None]] = None,
+    stream_cb: Optional[Callable[[str, Optional[str]], None]] = None
+) -> Dict[str, str]:
+    """Run the pipeline and return stage outputs.
+
+    ``completed`` holds stage outputs from an earlier run of the same prompt
+    which are reused instead of regenerated; ``on_result`` is called with
+    ``(stage, output)`` as each new stage finishes so callers can persist it.
+    ``stream_cb`` is called with ``(stage, delta)`` as standard-pipeline
+    stages stream tokens from Ollama; a ``None`` delta means the attempt
+    failed and the stage's text so far should be discarded before a retry.
+    """
+    events = _CallbackQueue() if (progress_cb or on_result or stream_cb) else None
+    if events:
+        # Callbacks run in order on a drainer thread, off the pipeline's critical path
+        progress_cb, on_result, stream_cb = map(events.wrap, (progress_cb, on_result, stream_cb))
+    try:
+        return _run_full_pipeline(prompt, progress_cb, mode, completed, on_result, stream_cb)
+    finally:
+        if events:
+            events.close()
+        stats = llm_cache.response_cache.stats
+        logger.info(f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses")
+
+
+async def arun_full_pipeline(prompt: str, **kwargs: Any) -> Dict[str, str]:
+    """Run the pipeline on a worker thread without blocking the event loop."""
+    return await asyncio.to_thread(run_full_pipeline, prompt, **kwargs)
+
+async def arun_pipelines(prompts: Iterable[str], mode: Optional[str] = None) -> List[Any]:
+    """Run several prompts' pipelines concurrently.
+
+    Each prompt's stages depend on one another, so the overlap is across
+    prompts. Concurrency is bounded by the ``max_inflight_requests`` setting;
+    failed prompts return their exception in place of a result.
+    """
+    limit = asyncio.Semaphore(_ollama_manager().max_inflight)
+
+    async def run_one(prompt: str) -> Dict[str, str]:
+        async with limit:
+            return await arun_full_pipeline(prompt, mode=mode)
+
+    return await asyncio.gather(*(run_one(p) for p in prompts), return_exceptions=True)
+
+def run_pipelines(prompts: Iterable[str], mode: Optional[str] = None) -> List[Any]:
+    """Synchronous wrapper around arun_pipelines."""
+    return asyncio.run(arun_pipelines(prompts, mode))
+
+
+def _run_full_pipeline(
+    prompt: str,
+    progress_cb: Optional[Callable] = None,
+    mode: Optional[str] = None,
+    completed: Optional[Dict[str, str]] = None,
+    on_result: Optional[Callable[[str, str], None]] = None,
+    stream_cb: Optional[Callable[[str, Optional[str]], None]] = None
 ) -> Dict[str, str]:
-    """Run the pipeline and return stage outputs."""
     if not prompt or not prompt.strip():
         raise ValueError("Prompt is empty")
 
     mode = (mode or DEFAULT_MODE).lower()
-    if mode == "auto" and _should_solve(prompt):
-        mode = "solve"
+    if mode == "auto":
+        answer = _evaluate_arithmetic(prompt)
+        if answer is not None:
+            # Nothing to enhance or ask a model: answer directly
+            _emit_progress(progress_cb, "start")
+            _emit_progress(progress_cb, "complete", answer)
+            return {"comprehensive": answer}
+        if _should_solve(prompt):
+            mode = "solve"
 
     results: Dict[str, str] = {}
     _emit_progress(progress_cb, "start")
 
     if mode == "solve":
-        results["solved"] = retry_with_fallback(
-            solve_problem, prompt, OLLAMA_MODELS["comprehensive"]
-        )
-        results["comprehensive"] = retry_with_fallback(
-            verify_answer,
-            prompt,
-            results["solved"],
+        _warm_models([
+            OLLAMA_MODELS["comprehensive"],
             OLLAMA_MODELS.get("presenter", OLLAMA_MODELS["comprehensive"]),
-        )
+        ])
+        results["solved"] = _pool(OLLAMA_MODELS["comprehensive"]).call(solve_problem, prompt)
+        # Only the verified answer is shown, so only that call streams
+        with _streaming(partial(stream_cb, "comprehensive") if stream_cb else None):
+            results["comprehensive"] = _pool(
+                OLLAMA_MODELS.get("presenter", OLLAMA_MODELS["comprehensive"])
+            ).call(verify_answer, prompt, results["solved"])
         _emit_progress(progress_cb, "complete", results["comprehensive"])
         return results
 
     if mode == "boost":
         """Boost mode: Use reflection to increase intelligence of weak LLMs"""
         boost_model = "mistral:latest"
+        _warm_models([boost_model])
 
-        def safe_generate(prompt_text: str) -> str:
-            msgs = [{"role": "user", "content": prompt_text}]
+        # Every stage extends one conversation with the same model, so each
+        # call only prefills its new turn instead of the whole context again
+        conversation: List[Dict] = []
+
+        def safe_generate(stage: str, prompt_text: str) -> str:
+            turn = [SYSTEM_PROMPTS[stage], {"role": "user", "content": prompt_text}]
+            msgs = conversation + turn
             try:
-                return generate_with_reflection(boost_model, msgs)
+                reply = generate_with_reflection(boost_model, msgs)
             except Exception as e:
                 logger.warning(f"Boost reflection failed: {e}")
-                return _chat(boost_model, msgs)["message"]["content"]
-
-        # Analysis stage
-        analysis_text = f"""Analyze this prompt: '{prompt}'
-
-Focus on:
-1. Core requirements and goals
-2. Key components needed
-3. Specific constraints or parameters
-4. Expected output format
-5. Quality criteria
+                reply = _chat(boost_model, msgs)["message"]["content"]
+            conversation.extend(turn + [{"role": "assistant", "content": reply}])
+            return reply
 
-Provide a clear, focused analysis that will help in improving this exact prompt."""
-        results["analysis"] = safe_generate(analysis_text)
+        results["analysis"] = safe_generate("analysis", f"Analyze this prompt: '{prompt}'")
         _emit_progress(progress_cb, "analysis_done", results["analysis"])
 
-        # Generation stage
-        gen_text = f"""Based on this analysis: '{results["analysis"]}'
-
-Generate specific improvements that:
-1. Address identified issues
-2. Enhance clarity and specificity
-3. Add necessary structure
-4. Maintain focus on core goals
-5. Consider all quality criteria
-
-Important: Generate practical, focused improvements that directly enhance the prompt."""
-        results["generation"] = safe_generate(gen_text)
+        results["generation"] = safe_generate("generation", "The analysis is your previous reply.")
         _emit_progress(progress_cb, "generation_done", results["generation"])
 
-        # Vetting stage
-        vet_text = f"""Review these suggested improvements: '{results["generation"]}'
-
-Evaluate how well they enhance the original prompt:
-1. Do they address core requirements?
-2. Are they clear and specific?
-3. Do they maintain focus on the task?
-4. Are they practical and implementable?
-
-Focus on validating improvements that directly enhance the original prompt."""
-        results["vetting"] = safe_generate(vet_text)
+        results["vetting"] = safe_generate(
+            "vetting", "The suggested improvements are your previous reply."
+        )
         _emit_progress(progress_cb, "vetting_done", results["vetting"])
 
-        # Finalize stage
-        final_text = f"""Original Prompt: {prompt}
-Validated Improvements: {results["vetting"]}
-
-Create an improved version that:
-1. Maintains the original goal
-2. Incorporates validated improvements
-3. Uses clear, specific language
-4. Adds necessary structure
-5. Includes any required constraints
-
-Stay focused on the original task."""
-        results["final"] = safe_generate(final_text)
+        results["final"] = safe_generate(
+            "finalization",
+            "The original prompt is the one analyzed above; the validated "
+            "improvements are your previous reply."
+        )
         _emit_progress(progress_cb, "finalize_done", results["final"])
 
-        # Enhance stage
-        enhance_text = f"""Polish and refine this prompt:
-
-{results["final"]}
-
-Focus on:
-1. Making instructions crystal clear
-2. Adding any missing details
-3. Improving structure
-4. Ensuring completeness
-5. Maintaining focus
-
-Stay focused on improving THIS prompt."""
-        results["enhanced"] = safe_generate(enhance_text)
+        results["enhanced"] = safe_generate("enhancement", "Polish the prompt in your previous reply.")
         _emit_progress(progress_cb, "enhance_done", results["enhanced"])
 
-        # Comprehensive review
-        comp_text = f"""Review all versions and create refined prompt:
-Original: {prompt}
-Analysis: {results["analysis"]}
-Generation: {results["generation"]}
-Vetting: {results["vetting"]}
-Final: {results["final"]}
-Enhanced: {results["enhanced"]}
-
-Combine best elements for maximum clarity and effectiveness."""
-        results["comprehensive"] = safe_generate(comp_text)
+        results["comprehensive"] = safe_generate(
+            "comprehensive",
+            "The versions are the original prompt and your replies above."
+        )
         _emit_progress(progress_cb, "complete", results["comprehensive"])
         return results
 
-    # Original pipeline
-    results["analysis"] = retry_with_fallback(
-        analyze_prompt, prompt, OLLAMA_MODELS["analysis"]
-    )
-    _emit_progress(progress_cb, "analysis_done", results["analysis"])
+    # Original pipeline; phases found in ``completed`` are reused, not rerun
+    completed = completed or {}
+    # Resolve every stage model once instead of indexing the global per stage
+    (
+        analysis_model, generation_model, vetting_model,
+        finalization_model, enhancement_model, comprehensive_model,
+    ) = (OLLAMA_MODELS[k] for k in (
+        "analysis", "generation", "vetting", "finalization", "enhancement", "comprehensive"
+    ))
+    _warm_models([
+        analysis_model, generation_model,
+        *((finalization_model,) if mode == "fast" else (vetting_model, finalization_model)),
+        enhancement_model, comprehensive_model,
+        OLLAMA_MODELS.get("presenter", comprehensive_model),
+    ])
 
-    results["generation"] = retry_with_fallback(
-        generate_solutions, results["analysis"], OLLAMA_MODELS["generation"]
-    )
-    _emit_progress(progress_cb, "generation_done", results["generation"])
+    # Consecutive stages on the same model continue one conversation, so
+    # each only prefills its new turn; a different model starts afresh.
+    conversation: Dict[str, Any] = {"model": None, "messages": []}
 
-    results["vetting"] = retry_with_fallback(
-        vet_and_refine, results["generation"], OLLAMA_MODELS["vetting"]
-    )
-    _emit_progress(progress_cb, "vetting_done", results["vetting"])
+    def run_stage(
+        key: str, phase: str, next_model: Optional[str],
+        model_name: str, func: Callable, *args: Any, **kwargs: Any
+    ) -> None:
+        if completed.get(key):
+            results[key] = completed[key]
+            conversation["model"] = None
+        else:
+            if func in _CONVERSATION_STAGES:
+                if conversation["model"] != model_name:
+                    conversation["model"], conversation["messages"] = model_name, []
+                kwargs["conversation"] = conversation["messages"]
+            if next_model:
+                # Load the following stage's model while this one generates
+                _prefetch_model(next_model)
+            with _streaming(partial(stream_cb, key) if stream_cb else None):
+                results[key] = _pool(model_name).call(func, *args, **kwargs)
+            if on_result:
+                on_result(key, results[key])
+        _emit_progress(progress_cb, phase, results[key])
 
-    results["final"] = retry_with_fallback(
-        finalize_prompt, results["vetting"], prompt, OLLAMA_MODELS["finalization"]
+    run_stage("analysis", "analysis_done", generation_model, analysis_model, analyze_prompt, prompt)
+    run_stage(
+        "generation", "generation_done",
+        finalization_model if mode == "fast" else vetting_model,
+        generation_model, generate_solutions, results["analysis"]
     )
-    _emit_progress(progress_cb, "finalize_done", results["final"])
 
-    results["enhanced"] = retry_with_fallback(
-        enhance_prompt, results["final"], OLLAMA_MODELS["enhancement"]
+    if mode == "fast" and not (completed.get("vetting") and completed.get("final")):
+        # Fast mode: vetting and finalization share one prefill and decode
+        _prefetch_model(enhancement_model)
+        sections = _SectionStream(
+            partial(stream_cb, "vetting"), partial(stream_cb, "final"),
+            lambda vetting: _emit_progress(progress_cb, "vetting_done", vetting)
+        ) if stream_cb else None
+        with _streaming(sections.feed if sections else None):
+            results["vetting"], results["final"] = _pool(finalization_model).call(
+                vet_and_finalize, results["generation"], prompt
+            )
+        if sections:
+            sections.finish()
+        conversation["model"] = None
+        if on_result:
+            on_result("vetting", results["vetting"])
+            on_result("final", results["final"])
+        if sections is None:
+            _emit_progress(progress_cb, "vetting_done", results["vetting"])
+        # Without a delimiter everything streamed was the final prompt, so the
+        # vetting phase is not reported separately
+        _emit_progress(progress_cb, "finalize_done", results["final"])
+    else:
+        run_stage(
+            "vetting", "vetting_done", finalization_model,
+            vetting_model, vet_and_refine, results["generation"]
+        )
+        run_stage(
+            "final", "finalize_done", enhancement_model,
+            finalization_model, finalize_prompt, results["vetting"], prompt
+        )
+
+    run_stage(
+        "enhanced", "enhance_done", comprehensive_model,
+        enhancement_model, enhance_prompt, results["final"]
     )
-    _emit_progress(progress_cb, "enhance_done", results["enhanced"])
 
-    results["comprehensive"] = retry_with_fallback(
+    review_kwargs = {}
+    if conversation["model"] == comprehensive_model and conversation["messages"]:
+        review_kwargs["prior_messages"] = conversation["messages"]
+    elif enhancement_model == comprehensive_model:
+        # Same model for both phases: keep one conversation so the review
+        # extends the enhancement context instead of starting from scratch.
+        review_kwargs["prior_messages"] = _enhance_messages(results["final"]) + [
+            {"role": "assistant", "content": results["enhanced"]}
+        ]
+
+    run_stage(
+        "comprehensive", "complete", None,
+        comprehensive_model,
         comprehensive_review,
         prompt,
         results["analysis"],
@@ -538,8 +1092,7 @@ Combine best elements for maximum clarity and effectiveness."""
         results["vetting"],
         results["final"],
         results["enhanced"],
-        OLLAMA_MODELS["comprehensive"],
+        **review_kwargs,
     )
-    _emit_progress(progress_cb, "complete", results["comprehensive"])
 
     return results
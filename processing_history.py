@@ -1,67 +1,167 @@
+import hashlib
+import json
+import logging
+import sqlite3
 import threading
+import time
+from collections import deque
 from datetime import datetime
 
+logger = logging.getLogger("prompt_enhancer")
+
 class ProcessingHistory:
     """Manages processing history and undo/redo functionality"""
-    def __init__(self):
-        self.history = []
-        self.current_index = -1
-        self.max_history = 50
+    def __init__(self, db_path=None, phase_ttl_seconds=24 * 3600):
+        # Two-stack undo: _undo ends with the current entry, _redo holds the
+        # entries after it with the next one on top
+        self._undo = deque(maxlen=50)
+        self._redo = []
         self._lock = threading.Lock()
+        self.phase_ttl_seconds = phase_ttl_seconds
+        self._db = self._open_db(db_path) if db_path else None
+        self.prune_phases()
+
+    @property
+    def max_history(self):
+        return self._undo.maxlen
+
+    @max_history.setter
+    def max_history(self, value):
+        with self._lock:
+            self._undo = deque(self._undo, maxlen=value)
+
+    @property
+    def history(self):
+        """All entries, oldest first"""
+        with self._lock:
+            return list(self._undo) + self._redo[::-1]
+
+    def export(self):
+        """All entries with ISO-formatted timestamps, for saving to JSON"""
+        return [
+            {**entry, 'timestamp': self.format_timestamp(entry['timestamp'])}
+            for entry in self.history
+        ]
+
+    @staticmethod
+    def format_timestamp(ts):
+        """Format an entry's epoch timestamp for display"""
+        return datetime.fromtimestamp(ts).isoformat()
+
+    @property
+    def current_index(self):
+        return len(self._undo) - 1
+
+    def _open_db(self, db_path):
+        """Open the per-phase results store in WAL mode"""
+        try:
+            conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS phases ("
+                "prompt_hash TEXT, phase TEXT, output TEXT, ts REAL, "
+                "PRIMARY KEY (prompt_hash, phase))"
+            )
+            return conn
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open history database: {e}")
+            return None
+
+    @staticmethod
+    def prompt_key(prompt, mode=None, models=None):
+        """Key phase results by prompt, pipeline mode and the stage models used"""
+        model_part = json.dumps(models or {}, sort_keys=True)
+        return hashlib.sha256(f"{mode or ''}\0{model_part}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def add_phase(self, prompt_key, phase, output):
+        """Persist one completed pipeline phase"""
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO phases VALUES (?, ?, ?, ?)",
+                    (prompt_key, phase, output, time.time())
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Failed to store {phase} phase: {e}")
+
+    def clear_phases(self, prompt_key):
+        """Forget a prompt's phases once its run has finished"""
+        self._delete_phases("DELETE FROM phases WHERE prompt_hash = ?", (prompt_key,))
+
+    def prune_phases(self):
+        """Drop phases left behind by runs older than ``phase_ttl_seconds``"""
+        self._delete_phases("DELETE FROM phases WHERE ts < ?", (time.time() - self.phase_ttl_seconds,))
+
+    def _delete_phases(self, sql, params):
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                self._db.execute(sql, params)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to delete stored phases: {e}")
+
+    def get_phases(self, prompt_key):
+        """Get previously completed phases for a prompt key"""
+        if self._db is None:
+            return {}
+        with self._lock:
+            try:
+                rows = self._db.execute(
+                    "SELECT phase, output FROM phases WHERE prompt_hash = ?",
+                    (prompt_key,)
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read stored phases: {e}")
+                return {}
+        return dict(rows)
         
     def add(self, input_text, output_text):
         """Add a new processing result to history thread-safely"""
+        entry = {
+            'input': input_text,
+            'output': output_text,
+            'timestamp': time.time()
+        }
         with self._lock:
-            # Remove any redo entries
-            self.history = self.history[:self.current_index + 1]
-            
-            entry = {
-                'input': input_text,
-                'output': output_text,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            self.history.append(entry)
-            self.current_index += 1
-            
-            # Trim history if too long
-            if len(self.history) > self.max_history:
-                self.history = self.history[-self.max_history:]
-                self.current_index = len(self.history) - 1
-                
+            # Remove any redo entries; the deque drops the oldest when full
+            self._redo.clear()
+            self._undo.append(entry)
+
     def can_undo(self):
         """Check if undo is available"""
-        return self.current_index > 0
-        
+        return len(self._undo) > 1
+
     def can_redo(self):
         """Check if redo is available"""
-        return self.current_index < len(self.history) - 1
-        
+        return bool(self._redo)
+
     def undo(self):
         """Get previous processing result"""
         with self._lock:
             if self.can_undo():
-                self.current_index -= 1
-                return self.history[self.current_index]
+                self._redo.append(self._undo.pop())
+                return self._undo[-1]
             return None
-        
+
     def redo(self):
         """Get next processing result"""
         with self._lock:
             if self.can_redo():
-                self.current_index += 1
-                return self.history[self.current_index]
+                self._undo.append(self._redo.pop())
+                return self._undo[-1]
             return None
-            
+
     def get_current(self):
         """Get current history entry"""
         with self._lock:
-            if 0 <= self.current_index < len(self.history):
-                return self.history[self.current_index]
-            return None
-            
+            return self._undo[-1] if self._undo else None
+
     def clear(self):
         """Clear history"""
         with self._lock:
-            self.history = []
-            self.current_index = -1
\ No newline at end of file
+            self._undo.clear()
+            self._redo.clear()
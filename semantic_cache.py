@@ -0,0 +1,70 @@
+import logging
+import os
+import threading
+from typing import Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger("prompt_enhancer")
+
+
+class SemanticCache:
+    """Response cache looked up by cosine similarity of prompt embeddings."""
+    def __init__(self, threshold: float = 0.92, path: Optional[str] = None):
+        self.threshold = threshold
+        self.path = path
+        self._vectors = None
+        self._responses = []
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def _normalize(self, vector: Sequence[float]):
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def lookup(self, vector: Sequence[float]) -> Optional[str]:
+        """Return the stored response whose embedding is closest above threshold."""
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                return None
+            sims = self._vectors @ query
+            best = int(sims.argmax())
+            if sims[best] >= self.threshold:
+                return self._responses[best]
+        return None
+
+    def add(self, vector: Sequence[float], response: str) -> None:
+        row = self._normalize(vector)[np.newaxis, :]
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != row.shape[1]:
+                self._vectors = row
+                self._responses = [response]
+            else:
+                self._vectors = np.vstack([self._vectors, row])
+                self._responses.append(response)
+            if self.path:
+                self._save()
+
+    def _load(self) -> None:
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self._vectors = data["vectors"].astype(np.float32)
+                self._responses = [str(r) for r in data["responses"]]
+        except Exception as e:
+            logger.warning(f"Failed to load semantic cache: {e}")
+
+    def _save(self) -> None:
+        try:
+            np.savez(self.path, vectors=self._vectors, responses=np.array(self._responses))
+        except Exception as e:
+            logger.warning(f"Failed to save semantic cache: {e}")
@@ -1,7 +1,9 @@
-import json
 import os
 import logging
-from typing import Any, Dict
+import threading
+from typing import Any, Dict, Optional
+
+import json_utils
 
 logger = logging.getLogger("prompt_enhancer")
 
@@ -17,6 +19,12 @@ class SettingsManager:
             'mode': 'auto',
             'request_timeout': 2,
             'model_timeout_ms': 120000,
+            'ollama_keep_alive': '30m',
+            'max_inflight_requests': 4,
+            'api_process': True,
+            'api_threads': 8,
+            'thread_pool_size': 32,
+            'response_cache_ttl': 604800,
             'show_model_indicators': True,
             'save_window_state': True,
             'window': {
@@ -25,13 +33,15 @@ class SettingsManager:
             }
         }
         self.settings = self.load_settings()
+        self._save_timer: Optional[threading.Timer] = None
+        self._save_lock = threading.Lock()
         
     def load_settings(self) -> Dict[str, Any]:
         """Load settings from file."""
         try:
             if os.path.exists(self.settings_file):
-                with open(self.settings_file, 'r') as f:
-                    loaded = json.load(f)
+                with open(self.settings_file, 'rb') as f:
+                    loaded = json_utils.loads(f.read())
                     # Merge with defaults to ensure all settings exist
                     return {**self.default_settings, **loaded}
             return self.default_settings.copy()
@@ -41,9 +51,17 @@ class SettingsManager:
             
     def save_settings(self) -> None:
         """Save current settings to file."""
+        with self._save_lock:
+            self._write_settings()
+
+    def _write_settings(self) -> None:
         try:
-            with open(self.settings_file, 'w') as f:
-                json.dump(self.settings, f, indent=2)
+            # Write a temp file and rename it over the old one so a crash
+            # mid-write never leaves a truncated settings file
+            tmp_file = self.settings_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(json_utils.dumps_indented(self.settings))
+            os.replace(tmp_file, self.settings_file)
         except Exception as e:
             logger.error(f"Failed to save settings: {e}")
             
@@ -56,7 +74,7 @@ class SettingsManager:
         try:
             self.settings[key] = value
             if self.get('autosave', True):
-                self.save_settings()
+                self._schedule_save()
         except Exception as e:
             logger.error(f"Failed to set setting {key}: {e}")
 
@@ -67,4 +85,21 @@ class SettingsManager:
             'zoomed': zoomed
         }
         if self.get('autosave', True):
+            self._schedule_save()
+
+    def _schedule_save(self, delay: float = 0.5) -> None:
+        """Save after ``delay`` seconds, so a burst of changes is written once."""
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(delay, self.save_settings)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self) -> None:
+        """Write any pending autosave now."""
+        with self._save_lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
             self.save_settings()
@@ -0,0 +1,86 @@
+import json
+import sys
+import types
+from functools import cached_property
+
+import pytest
+
+from settings_manager import SettingsManager
+
+
+class FakeOllamaManager:
+    __slots__ = ("ollama_ready", "max_inflight", "preloaded", "verified", "calls")
+
+    def __init__(self):
+        self.ollama_ready = True
+        self.max_inflight = 2
+        self.preloaded = []
+        self.verified = []
+        self.calls = []
+
+    def chat(self, model, messages, options=None, format=None):
+        self.calls.append((model, messages))
+        content = f"{model}::{messages[-1]['content'][:20]}"
+        if format == "json":
+            content = json.dumps({"draft": "d", "critique": "c", "final": content, "prompt": content})
+        return {"message": {"content": content}}
+
+    def preload(self, model):
+        self.preloaded.append(model)
+
+    def verify_model(self, model):
+        self.verified.append(model)
+        return model != "missing:latest"
+
+    def chat_stream(self, model, messages, options=None):
+        content = self.chat(model, messages, options)["message"]["content"]
+        yield content[:5]
+        yield content[5:]
+
+
+class DummyAppState:
+    def __init__(self):
+        self.ollama_manager = FakeOllamaManager()
+        self.root = None
+        self.status_bar = None
+
+    @cached_property
+    def settings_manager(self):
+        # Built on first use: most tests never read settings from disk
+        return SettingsManager()
+
+    def set_active_model(self, model_type):
+        return None
+
+
+def pytest_sessionstart(session):
+    """Stand in for main.app_state, which processing_functions imports lazily."""
+    main_mod = types.ModuleType("main")
+    main_mod.app_state = DummyAppState()
+    sys.modules["main"] = main_mod
+
+
+def pytest_sessionfinish(session, exitstatus):
+    sys.modules.pop("main", None)
+
+
+@pytest.fixture(scope="session")
+def pf(tmp_path_factory):
+    """processing_functions, imported after the main stub is in place.
+
+    The response cache's disk store is attached first, under a temp
+    directory, so the bootstrap keeps it instead of opening the real one.
+    """
+    import llm_cache
+    import processing_functions
+    llm_cache.attach_disk_cache(str(tmp_path_factory.mktemp("cache") / "llm_cache.db"), 3600)
+    yield processing_functions
+    llm_cache.close_disk_cache()
+
+
+@pytest.fixture(scope="session")
+def client():
+    from api import app
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
@@ -0,0 +1,30 @@
+import asyncio
+import json
+
+_TEST_PROMPT_BODY = json.dumps({'prompt': 'test prompt'}).encode('utf-8')
+
+
+def test_process_prompt(client, monkeypatch):
+    monkeypatch.setattr('api.run_full_pipeline', lambda prompt, mode=None: {'comprehensive': 'enhanced'})
+    response = client.post('/process_prompt', data=_TEST_PROMPT_BODY, content_type='application/json')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['output'] == 'enhanced'
+
+
+def test_process_batch_reports_each_prompt(client, monkeypatch):
+    monkeypatch.setattr('api.run_pipelines', lambda prompts, mode=None: [
+        {'comprehensive': 'enhanced'}, RuntimeError('model failed'), asyncio.CancelledError()
+    ])
+    response = client.post('/process_prompt', json={'prompts': ['a', 'b', 'c']})
+    assert response.status_code == 200
+    assert response.get_json()['outputs'] == [
+        {'output': 'enhanced'}, {'error': 'model failed'}, {'error': 'CancelledError'}
+    ]
+
+
+def test_process_batch_rejects_bad_items_and_oversized_batches(client, monkeypatch):
+    monkeypatch.setattr('api.run_pipelines', lambda prompts, mode=None: [])
+    assert client.post('/process_prompt', json={'prompts': ['a', 3]}).status_code == 400
+    monkeypatch.setattr('api.API_MAX_BATCH_SIZE', 2)
+    assert client.post('/process_prompt', json={'prompts': ['a', 'b', 'c']}).status_code == 400
@@ -0,0 +1,17 @@
+import pytest
+
+import json_utils
+
+_SAMPLE = {"b": True, "a": [1, 2.5, "é", None]}
+_SORTED_BYTES = '{"a":[1,2.5,"é",null],"b":true}'.encode("utf-8")
+
+
+def test_dumps_sorted_stdlib_matches_orjson_bytes(monkeypatch):
+    monkeypatch.setattr(json_utils, "orjson", None)
+    assert json_utils.dumps_sorted(_SAMPLE) == _SORTED_BYTES
+
+
+def test_dumps_sorted_orjson_bytes():
+    if json_utils.orjson is None:
+        pytest.skip("orjson is not installed")
+    assert json_utils.dumps_sorted(_SAMPLE) == _SORTED_BYTES
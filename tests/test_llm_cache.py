@@ -0,0 +1,45 @@
+import sqlite3
+
+from llm_cache import DiskCache, ResponseCache, cache_key
+
+
+def test_key_ignores_option_order():
+    messages = [{"role": "user", "content": "hi"}]
+    assert (
+        cache_key("m", messages, {"temperature": 0, "seed": 1})
+        == cache_key("m", messages, {"seed": 1, "temperature": 0})
+    )
+    assert cache_key("m", messages) != cache_key("n", messages)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(maxsize=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats == {"hits": 2, "misses": 1}
+
+
+def test_disk_cache_survives_a_new_memory_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = DiskCache(path)
+    ResponseCache(maxsize=2, disk=first).set("k", "cached reply")
+    second = DiskCache(path)
+    try:
+        assert ResponseCache(maxsize=2, disk=second).get("k") == "cached reply"
+        second.ttl_seconds = -1
+        assert ResponseCache(disk=second).get("k") is None
+    finally:
+        first.close()
+        second.close()
+
+
+def test_disk_cache_clear_survives_database_errors(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.db"))
+    cache._db.close()
+    cache._db = sqlite3.connect(":memory:", check_same_thread=False)  # no responses table
+    cache.clear()
+    cache.close()
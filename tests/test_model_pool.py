@@ -0,0 +1,130 @@
+import pytest
+
+import model_pool
+from model_pool import ModelPool
+
+
+@pytest.fixture(autouse=True)
+def _reset_health():
+    model_pool.reset_health()
+    yield
+    model_pool.reset_health()
+
+
+def test_falls_back_when_primary_fails():
+    calls = []
+
+    def stage(text, model_name):
+        calls.append(model_name)
+        if model_name == "primary":
+            raise RuntimeError("down")
+        return f"{model_name}:{text}"
+
+    pool = ModelPool("primary", ["backup"], backoff_base=0)
+    assert pool.call(stage, "x") == "backup:x"
+    assert calls == ["primary", "primary", "backup"]
+
+
+def test_open_circuit_skips_model():
+    for _ in range(model_pool.FAILURE_THRESHOLD):
+        model_pool.record_failure("primary")
+    calls = []
+
+    def stage(model_name):
+        calls.append(model_name)
+        return model_name
+
+    assert ModelPool("primary", ["backup"], backoff_base=0).call(stage) == "backup"
+    assert calls == ["backup"]
+
+
+def test_service_breaker_fails_fast_then_probes():
+    breaker = model_pool.Breaker(threshold=2, open_seconds=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+    breaker.opened_at -= 60
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == model_pool.Breaker.CLOSED
+    assert breaker.allow()
+
+
+def test_pool_stops_when_service_circuit_opens(monkeypatch):
+    calls = []
+
+    def stage(model_name):
+        calls.append(model_name)
+        model_pool.service_breaker.record_failure()
+        raise RuntimeError("connection refused")
+
+    monkeypatch.setattr(model_pool.service_breaker, "threshold", 1)
+    with pytest.raises(RuntimeError):
+        ModelPool("primary", ["backup"], backoff_base=0).call(stage)
+    assert calls == ["primary"]
+
+
+def test_only_unreachable_server_counts_as_service_failure():
+    assert model_pool.is_service_failure(ConnectionRefusedError())
+    try:
+        raise RuntimeError("stage failed") from ConnectionError("refused")
+    except RuntimeError as e:
+        assert model_pool.is_service_failure(e)
+    assert not model_pool.is_service_failure(RuntimeError("model 'x' not found"))
+    assert not model_pool.is_service_failure(TimeoutError("read timed out"))
+
+
+def test_programming_errors_are_not_retried():
+    calls = []
+
+    def stage(model_name):
+        calls.append(model_name)
+        try:
+            return {}["message"]
+        except KeyError as e:
+            raise RuntimeError("stage failed") from e
+
+    with pytest.raises(RuntimeError):
+        ModelPool("primary", ["backup"], backoff_base=0).call(stage)
+    assert calls == ["primary"]
+
+
+def test_backoff_grows_and_honours_retry_after():
+    assert model_pool.backoff_delay(1) <= 1.0
+    assert model_pool.backoff_delay(3) >= 2.0
+    assert model_pool.backoff_delay(10) == 8.0
+    error = RuntimeError("busy")
+    error.retry_after = 3
+    assert model_pool.backoff_delay(1, error) == 3.0
+
+
+def test_timeout_tracks_observed_latency():
+    assert model_pool.timeout_for("m", 1000, 120000) == 120000
+    for _ in range(20):
+        model_pool.record_latency("m", 2.0)
+    timeout = model_pool.timeout_for("m", 1000, 120000)
+    assert timeout >= 4000
+    assert timeout < 12000
+    assert model_pool.timeout_for("m", 30000, 120000) == 30000
+
+
+def test_timeout_doubles_until_the_next_sample():
+    for _ in range(20):
+        model_pool.record_latency("m", 1.0)
+    assert model_pool.timeout_for("m", 30000, 120000) == 30000
+    model_pool.record_timeout("m")
+    assert model_pool.timeout_for("m", 30000, 120000) == 60000
+    model_pool.record_timeout("m")
+    model_pool.record_timeout("m")
+    assert model_pool.timeout_for("m", 30000, 120000) == 120000
+    model_pool.record_latency("m", 1.0)
+    assert model_pool.timeout_for("m", 30000, 120000) == 30000
+    try:
+        raise RuntimeError("stage failed") from TimeoutError("timed out")
+    except RuntimeError as e:
+        assert model_pool.is_timeout(e)
+    assert not model_pool.is_timeout(ConnectionRefusedError())
@@ -0,0 +1,42 @@
+import threading
+import time
+import types
+
+from ollama_service_manager import OllamaServiceManager
+
+
+def test_chat_calls_are_bounded_by_max_inflight():
+    app_state = types.SimpleNamespace(settings_manager=types.SimpleNamespace(
+        get=lambda key, default=None: 2 if key == "max_inflight_requests" else default
+    ))
+    lock = threading.Lock()
+    active, peak = [0], [0]
+    release = threading.Event()
+
+    class Client:
+        def __init__(self, **kwargs):
+            pass
+
+        def chat(self, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            release.wait(5)
+            with lock:
+                active[0] -= 1
+            return {"message": {"content": "ok"}}
+
+    manager = OllamaServiceManager(app_state)
+    manager.ollama_ready = True
+    manager.ollama_module = types.SimpleNamespace(Client=Client)
+    threads = [threading.Thread(target=manager.chat, kwargs={"model": "m"}) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Let the other three callers reach the semaphore while two calls hold it
+    time.sleep(0.1)
+    assert active[0] == 2
+    release.set()
+    for thread in threads:
+        thread.join()
+    manager.close()
+    assert peak[0] == 2
@@ -1,51 +1,270 @@
-import sys
-import types
-import unittest
+import pytest
 
-from settings_manager import SettingsManager
 
+@pytest.fixture(autouse=True)
+def _clear_stage_cache(pf):
+    for memo in pf._STAGE_MEMOS.values():
+        memo.clear()
 
-class FakeOllamaManager:
-    def __init__(self):
-        self.ollama_ready = True
 
-    def chat(self, model, messages, options=None):
-        content = f"{model}::{messages[-1]['content'][:20]}"
-        return {"message": {"content": content}}
+def test_run_full_pipeline(pf):
+    phases = []
 
+    def cb(phase, message, content):
+        phases.append(phase)
 
-class DummyAppState:
-    def __init__(self):
-        self.settings_manager = SettingsManager()
-        self.ollama_manager = FakeOllamaManager()
-        self.root = None
-        self.status_bar = None
+    results = pf.run_full_pipeline("test prompt", progress_cb=cb)
+    for key in ["analysis", "generation", "vetting", "final", "enhanced", "comprehensive"]:
+        assert key in results
+        assert results[key]
 
-    def set_active_model(self, model_type):
-        return None
+    assert phases[0] == "start"
+    assert "complete" in phases
+    assert pf.OLLAMA_MODELS["comprehensive"] in pf._ollama_manager().preloaded
 
 
-main_mod = types.ModuleType("main")
-main_mod.app_state = DummyAppState()
-sys.modules["main"] = main_mod
+def test_fast_mode_splits_vetting_and_final(pf):
+    vetting, final = pf._split_sections("Looks good.\n---\nImproved prompt")
+    assert vetting == "Looks good."
+    assert final == "Improved prompt"
 
-import processing_functions as pf
+    results = pf.run_full_pipeline("test prompt", mode="fast")
+    assert results["final"]
+    assert results["comprehensive"]
 
 
-class TestPipeline(unittest.TestCase):
-    def test_run_full_pipeline(self):
-        phases = []
+def test_fast_mode_streams_each_section(pf):
+    deltas = {"vetting": [], "final": []}
+    splits = []
+    sections = pf._SectionStream(deltas["vetting"].append, deltas["final"].append, splits.append)
+    for delta in ("Looks ", "good.\n-", "--\nImpro", "ved prompt"):
+        sections.feed(delta)
+    sections.finish()
+    assert "".join(deltas["vetting"]) == "Looks good.\n"
+    assert "".join(deltas["final"]) == "Improved prompt"
+    assert splits == ["Looks good."]
 
-        def cb(phase, message, content):
-            phases.append(phase)
 
-        results = pf.run_full_pipeline("test prompt", progress_cb=cb)
-        for key in ["analysis", "generation", "vetting", "final", "enhanced", "comprehensive"]:
-            self.assertIn(key, results)
-            self.assertTrue(results[key])
+def test_completed_stages_are_reused(pf):
+    stored = {}
+    completed = {"analysis": "cached analysis", "generation": "cached ideas"}
+    results = pf.run_full_pipeline(
+        "test prompt",
+        completed=completed,
+        on_result=lambda stage, output: stored.__setitem__(stage, output)
+    )
+    assert results["analysis"] == "cached analysis"
+    assert results["generation"] == "cached ideas"
+    assert "analysis" not in stored
+    assert "vetting" in stored
+    assert stored["comprehensive"] == results["comprehensive"]
 
-        self.assertEqual(phases[0], "start")
-        self.assertIn("complete", phases)
 
-if __name__ == "__main__":
-    unittest.main()
+def test_stream_cb_receives_stage_deltas(pf):
+    deltas = {}
+    results = pf.run_full_pipeline(
+        "test prompt",
+        mode="standard",
+        stream_cb=lambda stage, delta: deltas.setdefault(stage, []).append(delta)
+    )
+    assert "".join(deltas["analysis"]) == results["analysis"]
+    assert "".join(deltas["comprehensive"]) == results["comprehensive"]
+    assert set(deltas) == {"analysis", "generation", "vetting", "final", "enhanced", "comprehensive"}
+
+
+def test_reflection_uses_single_json_call(pf):
+    final = pf.generate_with_reflection("m", [{"role": "user", "content": "hello"}])
+    assert final.startswith("m::Answer the request")
+
+
+def test_stages_on_one_model_share_a_conversation(pf):
+    calls = pf._ollama_manager().calls
+    original = dict(pf.OLLAMA_MODELS)
+    pf.OLLAMA_MODELS.update({k: "same" for k in original if k != "presenter"})
+    del calls[:]
+    try:
+        results = pf.run_full_pipeline("test prompt", mode="standard")
+    finally:
+        pf.OLLAMA_MODELS.clear()
+        pf.OLLAMA_MODELS.update(original)
+    review_messages = next(m for model, m in calls if m[-1]["content"].startswith(
+        pf.SYSTEM_PROMPTS["comprehensive"]["content"]
+    ))
+    replies = [m["content"] for m in review_messages if m["role"] == "assistant"]
+    assert replies == [results[k] for k in ("analysis", "generation", "vetting", "final", "enhanced")]
+
+
+def test_repeated_stage_inputs_are_memoized(pf):
+    calls = pf._ollama_manager().calls
+    del calls[:]
+    first = pf.generate_solutions("same analysis", "m")
+    assert pf.generate_solutions("same analysis", "m") == first
+    assert len(calls) == 1
+    pf.generate_solutions("same analysis", "other")
+    assert len(calls) == 2
+
+
+def test_memo_hit_still_extends_the_conversation(pf):
+    calls = pf._ollama_manager().calls
+    del calls[:]
+    first, second = [], []
+    reply = pf.generate_solutions("same analysis", "m", conversation=first)
+    assert pf.generate_solutions("same analysis", "m", conversation=second) == reply
+    assert len(calls) == 1
+    assert second == first and second[-1] == {"role": "assistant", "content": reply}
+
+    # Earlier turns change the request, so they must not share the memo
+    pf.generate_solutions("same analysis", "m", conversation=second)
+    assert len(calls) == 2
+
+
+def test_boost_mode_extends_one_conversation(pf):
+    calls = pf._ollama_manager().calls
+    del calls[:]
+    results = pf.run_full_pipeline("test prompt", mode="boost")
+    last_messages = calls[-1][1]
+    replies = [m["content"] for m in last_messages if m["role"] == "assistant"]
+    assert replies == [results[k] for k in ("analysis", "generation", "vetting", "final", "enhanced")]
+
+
+def test_presenter_returns_json_prompt_when_not_streaming(pf):
+    calls = pf._ollama_manager().calls
+    del calls[:]
+    review = pf.comprehensive_review("p", "a", "s", "v", "f", "e", "m")
+    assert review == f"{pf.OLLAMA_MODELS['presenter']}::m::Original: p\nAnaly"
+    assert calls[-1][1][0] == pf.SYSTEM_PROMPTS["presenter_json"]
+
+
+def test_run_pipelines_returns_one_result_per_prompt(pf):
+    first, second, third = pf.run_pipelines(["2 + 2", "test prompt", " "], mode="auto")
+    assert first["comprehensive"] == "4"
+    assert "comprehensive" in second
+    assert isinstance(third, ValueError)
+
+
+def test_arithmetic_prompt_skips_models(pf):
+    assert pf._evaluate_arithmetic("2 + 2 =") == "4"
+    assert pf._evaluate_arithmetic("(1.5 * 4) / 3") == "2"
+    assert pf._evaluate_arithmetic("2 ** 99999") is None
+    assert pf._evaluate_arithmetic("1 / 0") is None
+    assert pf._evaluate_arithmetic("Write a poem") is None
+    assert pf._evaluate_arithmetic("42") is None
+    assert pf._evaluate_arithmetic("9" * 2500 + "*" + "9" * 2500) is None
+    assert pf._evaluate_arithmetic("9" * 400 + ".0 * 10") is None
+    assert pf.run_full_pipeline("3*(2+1)", mode="auto") == {"comprehensive": "9"}
+    assert pf._evaluate_arithmetic("1" + "+1" * 1000) is None
+    assert pf.run_full_pipeline("1" + "+1" * 1500, mode="auto")["comprehensive"]
+
+
+def test_validate_models_reports_missing(pf):
+    assert pf.validate_models() == []
+    original = dict(pf.OLLAMA_MODELS)
+    pf.OLLAMA_MODELS["analysis"] = "missing:latest"
+    pf.OLLAMA_MODELS["generation"] = "missing"
+    verified = pf._ollama_manager().verified
+    del verified[:]
+    try:
+        assert pf.validate_models() == [("analysis", "missing:latest"), ("generation", "missing")]
+        assert len([m for m in verified if m.startswith("missing")]) == 1
+    finally:
+        pf.OLLAMA_MODELS.clear()
+        pf.OLLAMA_MODELS.update(original)
+
+
+def test_model_errors_do_not_trip_service_breaker(pf, monkeypatch):
+    def fail(self, **kwargs):
+        raise RuntimeError("model 'm' not found")
+
+    monkeypatch.setattr(type(pf._ollama_manager()), "chat", fail)
+    try:
+        for _ in range(pf.model_pool.FAILURE_THRESHOLD):
+            with pytest.raises(RuntimeError):
+                pf._dispatch_chat("m", [{"role": "user", "content": "x"}])
+        assert not pf.model_pool.service_breaker.is_open()
+    finally:
+        pf.model_pool.reset_health()
+
+
+def test_programming_errors_stop_the_pipeline_without_fallback(pf, monkeypatch):
+    attempts = []
+
+    def broken(self, model, messages, **kwargs):
+        attempts.append(model)
+        raise TypeError("bad argument")
+
+    monkeypatch.setattr(type(pf._ollama_manager()), "chat", broken)
+    with pytest.raises(Exception) as raised:
+        pf.run_full_pipeline("test prompt", mode="standard")
+    assert pf.model_pool.is_retryable(raised.value) is False
+    assert len(attempts) == 1
+
+
+def test_failed_stream_attempt_is_voided_before_retry(pf, monkeypatch):
+    stream = type(pf._ollama_manager()).chat_stream
+    failed = []
+
+    def flaky(self, model, messages, options=None):
+        if not failed:
+            failed.append(model)
+            yield "partial"
+            raise RuntimeError("connection reset mid-stream")
+        yield from stream(self, model, messages, options)
+
+    monkeypatch.setattr(type(pf._ollama_manager()), "chat_stream", flaky)
+    monkeypatch.setattr(pf.model_pool, "backoff_delay", lambda *args, **kwargs: 0.0)
+    deltas = []
+    try:
+        results = pf.run_full_pipeline(
+            "test prompt", mode="standard",
+            stream_cb=lambda stage, delta: deltas.append((stage, delta))
+        )
+    finally:
+        pf.model_pool.reset_health()
+    analysis = [delta for stage, delta in deltas if stage == "analysis"]
+    assert analysis[:2] == ["partial", None]
+    assert "".join(analysis[2:]) == results["analysis"]
+
+
+def test_section_stream_reset_voids_both_sections(pf):
+    seen = []
+    sections = pf._SectionStream(
+        lambda d: seen.append(("before", d)), lambda d: seen.append(("after", d)), lambda v: None
+    )
+    sections.feed("Looks good.\n---\nImpro")
+    sections.feed(None)
+    assert seen[-2:] == [("after", None), ("before", None)]
+    assert not sections.split
+
+
+def test_bootstrap_keeps_the_attached_disk_cache(pf):
+    pf._ollama_manager()
+    assert pf.llm_cache.response_cache.disk is not None
+    assert pf.llm_cache.response_cache.disk._db is not None
+
+
+def test_timed_out_call_backs_off_that_models_timeout(pf, monkeypatch):
+    def slow(self, **kwargs):
+        raise TimeoutError("timed out")
+
+    monkeypatch.setattr(type(pf._ollama_manager()), "chat", slow)
+    pf.model_pool.record_latency("m", 0.001)
+    try:
+        before = pf.model_pool.timeout_for("m", 1000, 120000)
+        with pytest.raises(TimeoutError):
+            pf._dispatch_chat("m", [{"role": "user", "content": "x"}])
+        assert pf.model_pool.timeout_for("m", 1000, 120000) == 2 * before
+    finally:
+        pf.model_pool.reset_health()
+
+
+def test_review_memo_still_runs_the_presenter_per_sink(pf):
+    calls = pf._ollama_manager().calls
+    del calls[:]
+    pf.comprehensive_review("p", "a", "s", "v", "f", "e", "m")
+    deltas = []
+    with pf._streaming(deltas.append):
+        streamed = pf.comprehensive_review("p", "a", "s", "v", "f", "e", "m")
+    system_prompts = [messages[0] for _, messages in calls]
+    assert system_prompts.count(pf.SYSTEM_PROMPTS["comprehensive"]) == 1
+    assert system_prompts[-1] == pf.SYSTEM_PROMPTS["presenter"]
+    assert "".join(deltas) == streamed
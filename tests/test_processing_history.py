@@ -0,0 +1,61 @@
+from processing_history import ProcessingHistory
+
+
+def test_phases_persist_across_instances(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    key = ProcessingHistory.prompt_key("test prompt", "auto")
+
+    history = ProcessingHistory(db_path=db_path)
+    history.add_phase(key, "analysis", "first")
+    history.add_phase(key, "analysis", "second")
+    history.add_phase(key, "generation", "ideas")
+    history._db.close()
+
+    reopened = ProcessingHistory(db_path=db_path)
+    try:
+        assert reopened.get_phases(key) == {"analysis": "second", "generation": "ideas"}
+        assert reopened.get_phases(ProcessingHistory.prompt_key("other")) == {}
+    finally:
+        reopened._db.close()
+
+
+def test_without_db_phases_are_not_stored():
+    history = ProcessingHistory()
+    history.add_phase("key", "analysis", "text")
+    assert history.get_phases("key") == {}
+
+
+def test_undo_redo_and_trimming():
+    history = ProcessingHistory()
+    history.max_history = 3
+    for i in range(4):
+        history.add(f"in{i}", f"out{i}")
+    assert [e["input"] for e in history.history] == ["in1", "in2", "in3"]
+    assert history.undo()["input"] == "in2"
+    assert history.undo()["input"] == "in1"
+    assert history.undo() is None
+    assert history.redo()["input"] == "in2"
+    history.add("new", "out")
+    assert not history.can_redo()
+    assert [e["input"] for e in history.history] == ["in1", "in2", "new"]
+    assert isinstance(history.export()[0]["timestamp"], str)
+
+
+def test_finished_and_stale_phases_are_dropped(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    models = {"analysis": "a:latest"}
+    key = ProcessingHistory.prompt_key("test prompt", "auto", models)
+    assert key != ProcessingHistory.prompt_key("test prompt", "auto", {"analysis": "b:latest"})
+
+    history = ProcessingHistory(db_path=db_path)
+    try:
+        history.add_phase(key, "analysis", "text")
+        history.clear_phases(key)
+        assert history.get_phases(key) == {}
+
+        history.add_phase(key, "analysis", "text")
+        history.phase_ttl_seconds = -1
+        history.prune_phases()
+        assert history.get_phases(key) == {}
+    finally:
+        history._db.close()
@@ -0,0 +1,13 @@
+import pytest
+
+from semantic_cache import SemanticCache
+
+pytestmark = pytest.mark.skipif(not SemanticCache.available(), reason="numpy is not installed")
+
+
+def test_lookup_matches_similar_vectors_only():
+    cache = SemanticCache(threshold=0.9)
+    assert cache.lookup([1.0, 0.0]) is None
+    cache.add([1.0, 0.0], "stored")
+    assert cache.lookup([2.0, 0.1]) == "stored"
+    assert cache.lookup([0.0, 1.0]) is None
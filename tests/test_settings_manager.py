@@ -0,0 +1,38 @@
+import pytest
+
+from settings_manager import SettingsManager
+
+
+@pytest.fixture(scope="session")
+def settings_dir(tmp_path_factory):
+    """One directory for the whole run; each test gets its own file in it."""
+    return tmp_path_factory.mktemp("settings")
+
+
+@pytest.fixture
+def settings_file(settings_dir, request):
+    return settings_dir / f"{request.node.name}.json"
+
+
+@pytest.fixture
+def make_manager(settings_file):
+    """Build SettingsManagers that all read and write ``settings_file``."""
+    def make():
+        manager = SettingsManager()
+        manager.settings_file = str(settings_file)
+        manager.settings = manager.load_settings()
+        return manager
+    return make
+
+
+def test_saved_settings_are_loaded_back(make_manager, settings_file):
+    manager = make_manager()
+    manager.set("font_size", 14)
+    manager.set("font_size", 16)
+    assert not settings_file.exists()  # autosave is debounced
+    manager.flush()
+    assert not settings_file.with_name(settings_file.name + ".tmp").exists()
+
+    reloaded = make_manager()
+    assert reloaded.get("font_size") == 16
+    assert reloaded.get("theme") == "dark"
@@ -1,39 +1,100 @@
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import json
+import collections
 import time
 import psutil
 import logging
 from typing import Optional, Union, Tuple
 
+import json_utils
+from config import TK_CALL_STATS
+
 logger = logging.getLogger("prompt_enhancer")
 
 
+_output_widget: Optional[ctk.CTkTextbox] = None
+
+
 def set_output_widget(widget):
     """Bind the global output widget for update_output()."""
-    update_output.output_widget = widget
+    global _output_widget
+    _output_widget = widget
+
+
+def _replace_text(widget, text: str):
+    """Swap a textbox's contents in one Tk edit instead of a delete then an insert"""
+    # CTkTextbox does not expose Text.replace; the tk.Text it wraps does
+    getattr(widget, "_textbox", widget).replace("1.0", "end", text)
 
 
 def _set_text(widget, text: str):
     widget.configure(state="normal")
-    widget.delete("1.0", "end")
-    widget.insert("end", text)
+    _replace_text(widget, text)
     widget.configure(state="disabled")
 
 
+def _scroll_to_end(widget):
+    """Scroll to the end once the idle queue runs, so a burst of inserts scrolls once"""
+    if getattr(widget, "_see_pending", False):
+        return
+    widget._see_pending = True
+
+    def see():
+        widget._see_pending = False
+        widget.see("end")
+
+    widget.after_idle(see)
+
+
 def clear_input(input_text=None):
     if input_text:
         input_text.delete("1.0", "end")
 
+class _TkCallCounter:
+    """Count calls to wrapped widget methods and log their rates every interval"""
+    def __init__(self, name, interval=60.0):
+        self.name = name
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._since = time.monotonic()
+
+    def wrap(self, widget, method, label):
+        original = getattr(widget, method)
+        key = f"{label}.{method}"
+
+        def counted(*args, **kwargs):
+            self._count(key)
+            return original(*args, **kwargs)
+
+        setattr(widget, method, counted)
+
+    def _count(self, key):
+        self.counts[key] += 1
+        now = time.monotonic()
+        elapsed = now - self._since
+        if elapsed >= self.interval:
+            rates = ", ".join(f"{k}={n / elapsed:.2f}/s" for k, n in self.counts.most_common())
+            logger.info(f"{self.name} Tk calls: {rates}")
+            self.counts.clear()
+            self._since = now
+
 class StatusBar(ctk.CTkFrame):
     """Enhanced status bar with multiple indicators"""
     def __init__(self, parent):
         super().__init__(parent)
         self._update_timer = None
         self._memory_update_after = None
-        self._last_memory_update = 0
-        self._memory_update_interval = 15000  # 15 seconds
+        self._memory_update_interval = 15000  # 15 seconds, adapted to how fast RSS moves
+        self._memory_interval_min = 2000
+        self._memory_interval_max = 120000
+        self._last_rss = None
+        self._shown_memory_mb = None
+        self._memory_label_step_mb = 5.0
+        self._destroyed = False
+        self._last_status = ("Ready", False)
+        self._last_model_status = None
+        self._process = psutil.Process()
         self.setup_indicators()
         
     def setup_indicators(self):
@@ -71,8 +132,13 @@ class StatusBar(ctk.CTkFrame):
         )
         self.memory_label.pack(side="right", padx=20)
         
-        # Start memory monitoring with throttling
-        self._schedule_memory_update()
+        if TK_CALL_STATS:
+            counter = _TkCallCounter("Status bar")
+            for label in ("status", "model_status", "memory_label"):
+                counter.wrap(getattr(self, label), "configure", label)
+
+        # Start memory monitoring once the window is shown
+        self.winfo_toplevel().bind("<Map>", self._on_map, add="+")
         
     def toggle_theme(self):
         current = ctk.get_appearance_mode().lower()
@@ -87,28 +153,54 @@ class StatusBar(ctk.CTkFrame):
             pass
         
     def _schedule_memory_update(self):
-        """Schedule the next memory update with throttling"""
-        current_time = time.time() * 1000
-        if current_time - self._last_memory_update >= self._memory_update_interval:
-            self._update_memory()
-            self._last_memory_update = current_time
-            
-        # Schedule next update
+        """Refresh the memory readout every interval while the window is visible"""
+        self._memory_update_after = None
+        if not self.winfo_viewable():
+            # Minimized or hidden: stop waking up until the window is mapped again
+            return
+        self._update_memory()
+        self._memory_update_after = self.after(self._memory_update_interval, self._schedule_memory_update)
+
+    def _on_map(self, event=None):
+        if self._memory_update_after is None and not self._destroyed:
+            self._schedule_memory_update()
+
+    def destroy(self):
+        # The <Map> binding lives on the toplevel, which may outlive this bar
+        self._destroyed = True
         if self._memory_update_after:
             self.after_cancel(self._memory_update_after)
-        self._memory_update_after = self.after(self._memory_update_interval, self._schedule_memory_update)
-        
+            self._memory_update_after = None
+        super().destroy()
+
     def _update_memory(self):
         """Update memory usage indicator"""
         try:
-            process = psutil.Process()
-            memory_mb = process.memory_info().rss / 1024 / 1024
-            self.memory_label.configure(text=f"Memory: {memory_mb:.1f}MB")
-        except Exception as e:
+            rss = self._process.memory_info().rss
+            memory_mb = rss / 1024 / 1024
+            # Skip the label redraw for changes too small to matter
+            if self._shown_memory_mb is None or abs(memory_mb - self._shown_memory_mb) >= self._memory_label_step_mb:
+                self.memory_label.configure(text=f"Memory: {memory_mb:.1f}MB")
+                self._shown_memory_mb = memory_mb
+            self._adapt_memory_interval(rss)
+        except psutil.Error as e:
             logger.error(f"Failed to update memory usage: {e}")
         
+    def _adapt_memory_interval(self, rss):
+        """Poll less often while memory is steady and more often while it moves"""
+        if self._last_rss is not None:
+            change = abs(rss - self._last_rss) / max(self._last_rss, 1)
+            if change < 0.01:
+                self._memory_update_interval = min(self._memory_update_interval * 2, self._memory_interval_max)
+            elif change > 0.1:
+                self._memory_update_interval = max(self._memory_update_interval // 2, self._memory_interval_min)
+        self._last_rss = rss
+
     def set_model_status(self, status, is_error=False):
         """Update model status indicator"""
+        if (status, is_error) == self._last_model_status:
+            return
+        self._last_model_status = (status, is_error)
         self.model_status.configure(
             text=f"Models: {status}",
             text_color="red" if is_error else "gray"
@@ -116,6 +208,9 @@ class StatusBar(ctk.CTkFrame):
         
     def set_status(self, text, is_error=False):
         """Update main status indicator"""
+        if (text, is_error) == self._last_status:
+            return
+        self._last_status = (text, is_error)
         self.status.configure(
             text=text,
             text_color="red" if is_error else "gray"
@@ -127,6 +222,8 @@ class LoadingIndicator:
         self.parent = parent
         self.frame = ctk.CTkFrame(parent)
         self._progress_value = 0
+        self._anim_current = 0.0
+        self._anim_next = 0.0
         self._animation_after = None
         self._animation_speed = 50
         
@@ -138,6 +235,8 @@ class LoadingIndicator:
         self.label.pack(pady=5)
         
         self.frame.pack_forget()
+        # The indicator is not a widget itself, so cancel its timer when its frame goes
+        self.frame.bind("<Destroy>", self._cancel_animation)
         
     def start(self, progress=0):
         self._progress_value = progress / 100
@@ -146,26 +245,34 @@ class LoadingIndicator:
         self._start_animation()
         
     def _start_animation(self):
-        if self._animation_after:
-            self.parent.after_cancel(self._animation_after)
-            
-        def animate():
-            if not self.frame.winfo_ismapped():
-                return
-            current = self.progress.get()
-            target = min(self._progress_value + 0.1, 1.0)
-            if current < target:
-                self.progress.set(current + 0.01)
-                self._animation_after = self.parent.after(self._animation_speed, animate)
-            else:
-                self.progress.set(self._progress_value)
-                
-        self._animation_after = self.parent.after(0, animate)
-        
-    def stop(self):
+        self._cancel_animation()
+        self._anim_current = self._progress_value
+        self._anim_next = time.monotonic()
+        self._animation_after = self.parent.after(0, self._tick)
+
+    def _tick(self):
+        """Advance the bar one step toward just past the reported progress"""
+        self._animation_after = None
+        if not self.frame.winfo_ismapped():
+            return
+        target = min(self._progress_value + 0.1, 1.0)
+        if self._anim_current < target:
+            self._anim_current += 0.01
+            self.progress.set(self._anim_current)
+            # Aim at a fixed schedule so late ticks don't push every later frame back
+            self._anim_next += self._animation_speed / 1000
+            delay = max(0, int((self._anim_next - time.monotonic()) * 1000))
+            self._animation_after = self.parent.after(delay, self._tick)
+        else:
+            self.progress.set(self._progress_value)
+
+    def _cancel_animation(self, event=None):
         if self._animation_after:
             self.parent.after_cancel(self._animation_after)
             self._animation_after = None
+
+    def stop(self):
+        self._cancel_animation()
         self.frame.pack_forget()
         
     def update_label(self, text):
@@ -187,6 +294,8 @@ def create_scrolled_text(root, height=10, width=50, readonly=False):
         wrap="word",
         state="disabled" if readonly else "normal"
     )
+    # Configured once here; the output helpers only apply the tag
+    text.tag_config("error", foreground="red")
     return text
 
 def create_toolbar(root, input_text=None, output_text=None):
@@ -197,8 +306,7 @@ def create_toolbar(root, input_text=None, output_text=None):
         if not entry:
             return
         if input_text:
-            input_text.delete("1.0", "end")
-            input_text.insert("end", entry.get("input", ""))
+            _replace_text(input_text, entry.get("input", ""))
         if output_text:
             _set_text(output_text, entry.get("output", ""))
 
@@ -266,33 +374,85 @@ def create_model_indicators(root, models):
 
 def update_output(text, is_error=False):
     """Update output text widget with new content"""
-    if not hasattr(update_output, "output_widget"):
+    if _output_widget is None:
         logger.error("Output widget not set")
         return
         
     try:
         text = sanitize_output(text)
-        _set_text(update_output.output_widget, text)
+        _set_text(_output_widget, text)
             
         if is_error:
-            update_output.output_widget.tag_add("error", "1.0", "end")
-            update_output.output_widget.tag_configure("error", foreground="red")
-        update_output.output_widget.see("end")
+            _output_widget.tag_add("error", "1.0", "end")
+        _scroll_to_end(_output_widget)
         
     except Exception as e:
         logger.error(f"Failed to update output: {e}")
 
+def append_output(text, is_error=False):
+    """Append already-formatted text at the end of the output widget in a single insert"""
+    if _output_widget is None:
+        logger.error("Output widget not set")
+        return
+
+    try:
+        widget = _output_widget
+        widget.configure(state="normal")
+        if is_error:
+            widget.insert("end", text, "error")
+        else:
+            widget.insert("end", text)
+        widget.configure(state="disabled")
+        _scroll_to_end(widget)
+    except Exception as e:
+        logger.error(f"Failed to append output: {e}")
+
+def mark_output(name):
+    """Set mark ``name`` at the current end of the output widget.
+
+    The mark keeps left gravity, so text appended later lands after it.
+    """
+    if _output_widget is None:
+        logger.error("Output widget not set")
+        return
+
+    try:
+        textbox = getattr(_output_widget, "_textbox", _output_widget)
+        textbox.mark_set(name, "end-1c")
+        textbox.mark_gravity(name, "left")
+    except Exception as e:
+        logger.error(f"Failed to mark output: {e}")
+
+def replace_output_from(name, text):
+    """Replace everything from mark ``name`` to the end of the output with ``text``"""
+    if _output_widget is None:
+        logger.error("Output widget not set")
+        return
+
+    try:
+        widget = _output_widget
+        widget.configure(state="normal")
+        getattr(widget, "_textbox", widget).replace(name, "end", text)
+        widget.configure(state="disabled")
+        _scroll_to_end(widget)
+    except Exception as e:
+        logger.error(f"Failed to replace output: {e}")
+
+_PHASE_HINT_TIMEOUT = "\nThe model took too long to respond. Please try again."
+_PHASE_HINT_OLLAMA = "\nPlease ensure Ollama is running and try again."
+_PHASE_HINT_UNEXPECTED = "\nUnexpected error. Check the logs for details."
+
 def handle_phase_error(phase_name, error, progress_tracker, loading_indicator, current_output):
     """Handle errors during processing phases"""
     error_msg = f"\nError in {phase_name} phase: {str(error)}\n"
     logger.error(f"{phase_name} phase error: {error}")
     
     if "timeout" in str(error).lower():
-        error_msg += "\nThe model took too long to respond. Please try again."
+        error_msg += _PHASE_HINT_TIMEOUT
     elif isinstance(error, Exception):
-        error_msg += "\nPlease ensure Ollama is running and try again."
+        error_msg += _PHASE_HINT_OLLAMA
     else:
-        error_msg += f"\nUnexpected error. Check the logs for details."
+        error_msg += _PHASE_HINT_UNEXPECTED
         
     if current_output:
         error_msg = f"{current_output}\n{error_msg}"
@@ -304,7 +464,7 @@ def handle_phase_error(phase_name, error, progress_tracker, loading_indicator, c
 
 def reset_ui_state():
     """Reset UI elements to initial state"""
-    if hasattr(update_output, "output_widget"):
+    if _output_widget is not None:
         clear_output()
     
     from main import app_state
@@ -321,31 +481,50 @@ def clear_output(output_text=None):
         output_text.configure(state="normal")
         output_text.delete("1.0", "end")
         output_text.configure(state="disabled")
-    elif hasattr(update_output, "output_widget"):
-        update_output.output_widget.configure(state="normal")
-        update_output.output_widget.delete("1.0", "end")
-        update_output.output_widget.configure(state="disabled")
+    elif _output_widget is not None:
+        _output_widget.configure(state="normal")
+        _output_widget.delete("1.0", "end")
+        _output_widget.configure(state="disabled")
+
+def _output_target(output_text=None):
+    """Return the given output widget, or the bound one when none is passed"""
+    return output_text if output_text else _output_widget
+
+def _output_text(widget):
+    # end-1c leaves out the newline Tk always keeps at the end
+    return widget.get("1.0", "end-1c").strip()
 
 def copy_to_clipboard(output_text=None):
     """Copy output text to clipboard"""
-    if output_text:
-        text = output_text.get("1.0", "end").strip()
-        output_text.clipboard_clear()
-        output_text.clipboard_append(text)
-        output_text.update()
-    elif hasattr(update_output, "output_widget"):
-        text = update_output.output_widget.get("1.0", "end").strip()
-        update_output.output_widget.clipboard_clear()
-        update_output.output_widget.clipboard_append(text)
-        update_output.output_widget.update()
+    widget = _output_target(output_text)
+    if widget is not None:
+        text = _output_text(widget)
+        widget.clipboard_clear()
+        widget.clipboard_append(text)
+
+def _write_file_async(file_path, render, action):
+    """Encode and write a file on the I/O pool; the dialogs stay on the Tk thread"""
+    from main import app_state
+
+    def write():
+        try:
+            data = render()
+            with open(file_path, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            message = f"Failed to {action}: {e}"
+            logger.error(message)
+            app_state.schedule_ui(lambda: messagebox.showerror("Error", message))
+
+    if app_state.executor:
+        app_state.executor.submit(write)
+    else:
+        write()
 
 def save_output(output_text=None):
     """Save output text to file"""
-    text = ""
-    if output_text:
-        text = output_text.get("1.0", "end").strip()
-    elif hasattr(update_output, "output_widget"):
-        text = update_output.output_widget.get("1.0", "end").strip()
+    widget = _output_target(output_text)
+    text = _output_text(widget) if widget is not None else ""
         
     if text:
         file_path = filedialog.asksaveasfilename(
@@ -353,12 +532,7 @@ def save_output(output_text=None):
             filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
         )
         if file_path:
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(text)
-            except Exception as e:
-                logger.error(f"Failed to save output: {e}")
-                messagebox.showerror("Error", f"Failed to save file: {e}")
+            _write_file_async(file_path, lambda: text.encode('utf-8'), "save output")
 
 def export_history():
     """Export processing history to JSON file"""
@@ -370,12 +544,11 @@ def export_history():
             filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
         )
         if file_path:
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(app_state.processing_history.history, f, indent=2)
-            except Exception as e:
-                logger.error(f"Failed to export history: {e}")
-                messagebox.showerror("Error", f"Failed to export history: {e}")
+            entries = app_state.processing_history.export()
+            _write_file_async(file_path, lambda: json_utils.dumps(entries), "export history")
+
+# Characters stripped from model output in one str.translate pass
+_MARKUP_CHARS = str.maketrans("", "", "#`")
 
 def sanitize_output(text):
     """Clean up the output text"""
@@ -383,18 +556,13 @@ def sanitize_output(text):
         return ""
         
     # Remove common formatting artifacts
-    text = text.replace("```", "").replace("**", "")
-    text = text.replace("#", "").replace("`", "")
+    text = text.replace("```", "").replace("**", "").translate(_MARKUP_CHARS)
     
-    # Clean meta instructions
-    if "PRESENT TO USER:" in text:
-        text = text.replace("PRESENT TO USER:", "")
+    # Clean meta instructions; replace() returns the same string when the marker is absent
+    text = text.replace("PRESENT TO USER:", "")
         
-    # Clean up whitespace
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    text = "\n".join(lines)
-    
-    return text.strip()
+    # Strip each line once and drop the blank ones; the result needs no outer strip
+    return "\n".join(filter(None, map(str.strip, text.splitlines())))
 
 class OutputHandler:
     """Handles output text updates safely"""
@@ -402,16 +570,13 @@ class OutputHandler:
     def update(text_widget, text, is_error=False):
         try:
             text_widget.configure(state="normal")
-            text_widget.delete("1.0", "end")
-            text = sanitize_output(text)
-            text_widget.insert("end", text)
+            _replace_text(text_widget, sanitize_output(text))
             
             if is_error:
                 text_widget.tag_add("error", "1.0", "end")
-                text_widget.tag_configure("error", foreground="red")
                 
             text_widget.configure(state="disabled")
-            text_widget.see("end")
+            _scroll_to_end(text_widget)
             
         except Exception as e:
             logger.error(f"Failed to update output: {e}")